@@ -18,7 +18,7 @@ import os
 # Add the src directory to the Python path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
 
-from src.database import init_db
+from src.database import init_db, install_uvloop
 from src.brands_init import initialize_brands_data, get_brands_summary
 
 
@@ -62,4 +62,5 @@ async def main():
 
 
 if __name__ == "__main__":
+    install_uvloop()
     asyncio.run(main()) 
\ No newline at end of file
@@ -10,11 +10,10 @@ import logging
 from datetime import datetime
 from typing import Dict, List, Optional
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from sqlalchemy.orm import selectinload
+from sqlalchemy import select, func
 
 from .db_models import Distributor, Brand
-from .database import get_async_session
+from .database import get_async_session, install_uvloop
 
 logger = logging.getLogger(__name__)
 
@@ -41,12 +40,28 @@ async def load_brands_data() -> List[Dict]:
 
 async def get_or_create_distributor(
     session: AsyncSession, 
-    distributor_data: Dict
+    distributor_data: Dict,
+    cache: Optional[Dict[str, Distributor]] = None
 ) -> tuple[Optional[Distributor], bool]:
     """
     Get existing distributor or create new one
     Returns (distributor, was_created)
+    
+    Pass the same cache dict for every row of an import so distributors
+    shared by many brands are only looked up once.
     """
+    if cache is not None and distributor_data['code'] in cache:
+        return cache[distributor_data['code']], False
+    distributor, was_created = await _get_or_create_distributor(session, distributor_data)
+    if cache is not None and distributor is not None:
+        cache[distributor_data['code']] = distributor
+    return distributor, was_created
+
+
+async def _get_or_create_distributor(
+    session: AsyncSession, 
+    distributor_data: Dict
+) -> tuple[Optional[Distributor], bool]:
     # Check if distributor already exists
     stmt = select(Distributor).where(Distributor.code == distributor_data['code'])
     result = await session.execute(stmt)
@@ -170,13 +185,32 @@ async def initialize_brands_data() -> bool:
     brands_skipped = 0
     errors = 0
     
+    # Distributors resolved so far in this import, keyed by code
+    distributors_by_code: Dict[str, Distributor] = {}
+    
     async with get_async_session() as session:
         try:
+            # Resolve the batch's distributors and existing brands in two queries
+            # up front, so the per-row work below is dict/set lookups
+            distributor_codes = {
+                (brand_data.get('distributor') or {}).get('code') for brand_data in brands_data
+            } - {None}
+            result = await session.execute(
+                select(Distributor).where(Distributor.code.in_(distributor_codes))
+            )
+            distributors_by_code.update((d.code, d) for d in result.scalars())
+            
+            brand_codes = {brand_data.get('code') for brand_data in brands_data} - {None}
+            result = await session.execute(select(Brand.code).where(Brand.code.in_(brand_codes)))
+            existing_brand_codes = set(result.scalars())
+            
             # Process each brand entry
             for brand_data in brands_data:
                 try:
                     # Get or create distributor
-                    distributor_result = await get_or_create_distributor(session, brand_data['distributor'])
+                    distributor_result = await get_or_create_distributor(
+                        session, brand_data['distributor'], distributors_by_code
+                    )
                     if not distributor_result:
                         logger.error(f"Failed to get/create distributor for brand {brand_data['code']}")
                         errors += 1
@@ -189,11 +223,7 @@ async def initialize_brands_data() -> bool:
                         distributors_skipped += 1
                     
                     # Check if brand already exists
-                    stmt = select(Brand).where(Brand.code == brand_data['code'])
-                    result = await session.execute(stmt)
-                    existing_brand = result.scalar_one_or_none()
-                    
-                    if existing_brand:
+                    if brand_data['code'] in existing_brand_codes:
                         logger.debug(f"Brand {brand_data['code']} already exists, skipping")
                         brands_skipped += 1
                         continue
@@ -201,6 +231,7 @@ async def initialize_brands_data() -> bool:
                     # Create brand
                     brand = await create_brand(session, brand_data, distributor)
                     if brand:
+                        existing_brand_codes.add(brand_data['code'])
                         brands_created += 1
                     else:
                         errors += 1
@@ -235,27 +266,27 @@ async def get_brands_summary() -> Dict:
     async with get_async_session() as session:
         try:
             # Count distributors
-            stmt = select(Distributor)
-            result = await session.execute(stmt)
-            distributors = result.scalars().all()
+            total_distributors = await session.scalar(
+                select(func.count()).select_from(Distributor)
+            )
             
             # Count brands
-            stmt = select(Brand)
-            result = await session.execute(stmt)
-            brands = result.scalars().all()
+            total_brands = await session.scalar(
+                select(func.count()).select_from(Brand)
+            )
             
             # Get brands per distributor
-            stmt = select(Distributor).options(selectinload(Distributor.brands))
+            stmt = (
+                select(Distributor.code, func.count(Brand.id))
+                .outerjoin(Brand, Brand.distributor_id == Distributor.id)
+                .group_by(Distributor.id, Distributor.code)
+            )
             result = await session.execute(stmt)
-            distributors_with_brands = result.scalars().all()
-            
-            brands_per_distributor = {}
-            for dist in distributors_with_brands:
-                brands_per_distributor[dist.code] = len(dist.brands)
+            brands_per_distributor = {code: count for code, count in result.all()}
             
             return {
-                'total_distributors': len(distributors),
-                'total_brands': len(brands),
+                'total_distributors': total_distributors,
+                'total_brands': total_brands,
                 'brands_per_distributor': brands_per_distributor
             }
             
@@ -283,4 +314,5 @@ if __name__ == "__main__":
         else:
             print("Failed to import brands data")
     
+    install_uvloop()
     asyncio.run(main()) 
\ No newline at end of file
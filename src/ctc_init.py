@@ -13,8 +13,9 @@ from datetime import datetime
 from typing import Optional
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
-from .database import get_async_session
+from .database import get_async_session, install_uvloop
 from .db_models import CTCClass, CTCType, CTCCategory, Base
+from .storage import invalidate_ctc_cache
 
 logger = logging.getLogger(__name__)
 
@@ -276,6 +277,7 @@ class CTCInitializer:
                 
                 # Commit all changes
                 await session.commit()
+                invalidate_ctc_cache()
                 
                 logger.info(f"CTC categories import completed successfully!")
                 logger.info(f"  - Product Classes (Level 1): {imported_classes} imported")
@@ -360,22 +362,12 @@ async def initialize_ctc_categories() -> bool:
 def auto_initialize():
     """Synchronous wrapper for async initialization."""
     import asyncio
+    install_uvloop()
     try:
         return asyncio.run(initialize_ctc_categories())
     except Exception as e:
         logger.error(f"Auto-initialization failed: {e}")
         return False
 
-# Auto-initialization when module is imported
-def auto_initialize():
-    """Automatically initialize CTC categories when this module is imported."""
-    try:
-        if initialize_ctc_categories():
-            logger.info("CTC categories auto-initialization successful")
-        else:
-            logger.warning("CTC categories auto-initialization failed or not needed")
-    except Exception as e:
-        logger.error(f"CTC categories auto-initialization error: {e}")
-
 # Uncomment the line below to enable auto-initialization on import
 # auto_initialize() 
\ No newline at end of file
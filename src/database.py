@@ -1,10 +1,11 @@
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base
 from sqlalchemy import create_engine, text
-import logging 
-import json
-import pandas as pd
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Optional
 import asyncio
+import logging 
 import os
 
 logger = logging.getLogger('uvicorn.error')
@@ -17,6 +18,17 @@ engine = None
 AsyncSessionLocal = None
 Base = declarative_base()
 
+# Session opened by the db_session dependency for the current request, if any
+_request_session: ContextVar[Optional[AsyncSession]] = ContextVar("request_session", default=None)
+
+def install_uvloop():
+    """Run asyncio on uvloop when it is installed (uvicorn already does this for the server)."""
+    try:
+        import uvloop
+    except ImportError:
+        return
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+
 async def drop_all_tables():
     """Drop all tables from the database."""
     if engine is None:
@@ -35,7 +47,17 @@ async def init_db(drop_existing: bool = True, load_ctc_data: bool = False, load_
     global engine, AsyncSessionLocal
     DATABASE_URL = settings.database_url
 
-    engine = create_async_engine(DATABASE_URL, echo=False, future=True)
+    engine_args = {}
+    if DATABASE_URL.startswith("postgresql"):
+        engine_args["pool_size"] = settings.db_pool_size
+        engine_args["max_overflow"] = 0
+    connect_args = {}
+    if DATABASE_URL.startswith("postgresql+asyncpg"):
+        # Keep more server-side prepared statements per connection (default 100)
+        connect_args["prepared_statement_cache_size"] = 512
+    engine = create_async_engine(
+        DATABASE_URL, echo=False, future=True, connect_args=connect_args, **engine_args
+    )
     AsyncSessionLocal = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
     logger.info("Connecting to database")
@@ -47,6 +69,11 @@ async def init_db(drop_existing: bool = True, load_ctc_data: bool = False, load_
         await drop_all_tables()
 
     async with engine.begin() as conn:
+        if engine.dialect.name == "postgresql":
+            # Required by the gin_trgm_ops search indexes
+            await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            # Provides gen_random_uuid() for uuid server defaults before PostgreSQL 13
+            await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pgcrypto"))
         await conn.run_sync(Base.metadata.create_all)
     
     # Load CTC data if requested
@@ -83,12 +110,81 @@ async def init_db(drop_existing: bool = True, load_ctc_data: bool = False, load_
             logger.error(f"Failed to initialize brands data: {e}")
             # Don't fail the entire startup if brands loading fails
 
+@asynccontextmanager
+async def _shared_session(session: AsyncSession) -> AsyncIterator[AsyncSession]:
+    # The request's session is closed by db_session, not by each caller
+    yield session
+
+async def warm_pool():
+    """Open pool_size connections up front so early requests don't pay connect cost."""
+    if engine is None:
+        logger.warning("Engine not initialized, cannot warm connection pool")
+        return
+    size = engine.pool.size() if hasattr(engine.pool, "size") else 1
+    
+    async def probe():
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+    
+    # Run the probes concurrently so each one checks out a separate connection
+    await asyncio.gather(*(probe() for _ in range(size)))
+    logger.info(f"Warmed {size} database connections")
+
 def get_async_session():
-    """Get the async session factory. Raises an error if not initialized."""
+    """Get a session context manager. Raises an error if not initialized.
+    
+    Inside a request using the db_session dependency this reuses the request's
+    session, so several storage calls share one pool checkout.
+    """
+    session = _request_session.get()
+    if session is not None:
+        return _shared_session(session)
+    return new_async_session()
+
+def new_async_session():
+    """Always open a separate session, e.g. for queries run concurrently with asyncio.gather.
+    
+    An AsyncSession can't run statements concurrently, so such work must not
+    share the request's session.
+    """
     if AsyncSessionLocal is None:
         raise RuntimeError("Database not initialized. Call init_db() first.")
     return AsyncSessionLocal()
 
+@asynccontextmanager
+async def get_async_readonly_session() -> AsyncIterator[AsyncSession]:
+    """Session for read-only work: no autoflush, and a READ ONLY transaction on PostgreSQL.
+    
+    Reuses the request's session when one is active, like get_async_session.
+    """
+    session = _request_session.get()
+    if session is not None:
+        yield session
+        return
+    if AsyncSessionLocal is None:
+        raise RuntimeError("Database not initialized. Call init_db() first.")
+    async with AsyncSessionLocal(autoflush=False) as session:
+        if session.bind.dialect.name == "postgresql":
+            await session.connection(execution_options={"postgresql_readonly": True})
+        yield session
+
+def get_read_connection():
+    """Open a Core connection for read-only statements that need no ORM session."""
+    if engine is None:
+        raise RuntimeError("Database not initialized. Call init_db() first.")
+    return engine.connect()
+
+async def db_session() -> AsyncIterator[AsyncSession]:
+    """FastAPI dependency that opens one session for the whole request."""
+    if AsyncSessionLocal is None:
+        raise RuntimeError("Database not initialized. Call init_db() first.")
+    async with AsyncSessionLocal() as session:
+        token = _request_session.set(session)
+        try:
+            yield session
+        finally:
+            _request_session.reset(token)
+
 def get_database_url():
     """Get the database URL for synchronous operations."""
     from .config import settings
@@ -1,18 +1,41 @@
 from datetime import datetime, date
 from decimal import Decimal
-from sqlalchemy import (Column, Integer, Text, Boolean, String, Numeric, DateTime, Date, ForeignKey, Enum, Index, PrimaryKeyConstraint)
+from sqlalchemy import (Column, Integer, Text, Boolean, String, Numeric, DateTime, Date, ForeignKey, Enum, Index, PrimaryKeyConstraint, func, text)
 from sqlalchemy.orm import relationship
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import FunctionElement
 import uuid
 
 from .database import Base
 
+
+class gen_random_uuid(FunctionElement):
+    """Random UUID4 string generated by the database, for use as a server_default."""
+    type = String()
+    inherit_cache = True
+
+
+@compiles(gen_random_uuid, 'postgresql')
+def _pg_gen_random_uuid(element, compiler, **kw):
+    return "gen_random_uuid()::text"
+
+
+@compiles(gen_random_uuid)
+def _gen_random_uuid(element, compiler, **kw):
+    # SQLite has no UUID function, so format random bytes as a version 4 UUID
+    return (
+        "(lower(hex(randomblob(4)) || '-' || hex(randomblob(2)) || '-4' || "
+        "substr(hex(randomblob(2)), 2) || '-' || substr('89AB', 1 + abs(random()) % 4, 1) || "
+        "substr(hex(randomblob(2)), 2) || '-' || hex(randomblob(6))))"
+    )
+
 ### PRODUCT MODELS ###
 
 class ProductModel(Base):
     __tablename__ = "products"
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    uuid = Column(String, nullable=False, unique=True)
+    uuid = Column(String, nullable=False, unique=True, server_default=gen_random_uuid())
     distributor_name = Column(Text, nullable=False)
     brand_name = Column(Text, nullable=False)
     product_code = Column(Text, nullable=False, unique=True)
@@ -48,6 +71,35 @@ class ProductModel(Base):
     rebate_agreements = relationship("RebateAgreementProduct", back_populates="product")
     rebate_claims = relationship("RebateClaim", back_populates="product")
 
+    # Trigram indexes so the ILIKE '%q%' product search can avoid a seq scan
+    __table_args__ = (
+        Index('idx_products_name_trgm', 'product_name',
+              postgresql_using='gin', postgresql_ops={'product_name': 'gin_trgm_ops'}).ddl_if(dialect='postgresql'),
+        Index('idx_products_code_trgm', 'product_code',
+              postgresql_using='gin', postgresql_ops={'product_code': 'gin_trgm_ops'}).ddl_if(dialect='postgresql'),
+        Index('idx_products_brand_name_trgm', 'brand_name',
+              postgresql_using='gin', postgresql_ops={'brand_name': 'gin_trgm_ops'}).ddl_if(dialect='postgresql'),
+        Index('idx_products_category_name_trgm', 'category_name',
+              postgresql_using='gin', postgresql_ops={'category_name': 'gin_trgm_ops'}).ddl_if(dialect='postgresql'),
+    )
+
+
+def _search_text(column):
+    return func.coalesce(column, text("''"))
+
+
+# Full-text search document for products. search_products must filter on this
+# exact expression for Postgres to match it against the GIN index below.
+product_search_vector = func.to_tsvector(
+    text("'english'"),
+    _search_text(ProductModel.product_name)
+    .op('||')(text("' '")).op('||')(_search_text(ProductModel.product_code))
+    .op('||')(text("' '")).op('||')(_search_text(ProductModel.brand_name))
+    .op('||')(text("' '")).op('||')(_search_text(ProductModel.category_name)),
+)
+
+Index('idx_products_search_tsv', product_search_vector, postgresql_using='gin').ddl_if(dialect='postgresql')
+
 
 class PriceLevel(Base):
     __tablename__ = "price_levels"
@@ -69,6 +121,8 @@ class PriceLevel(Base):
     __table_args__ = (
         # Add a unique constraint to prevent duplicate price levels for the same product
         # You might want to adjust this based on your business logic
+        # Serves the per-product Trade price lookup in the analytics queries
+        Index('idx_price_levels_product_level', 'product_id', 'price_level'),
     )
 
 
@@ -138,8 +192,7 @@ class CTCType(Base):
     class_id = Column(
         Integer,
         ForeignKey("ctc_classes.id", ondelete="CASCADE"),
-        nullable=False,
-        index=True
+        nullable=False
     )
 
     # Relationships
@@ -151,7 +204,9 @@ class CTCType(Base):
         Index('idx_ctc_types_uuid', 'uuid'),
         Index('idx_ctc_types_code', 'code'),
         Index('idx_ctc_types_store', 'store'),
-        Index('idx_ctc_types_class_id', 'class_id'),
+        # Covers the CategoryView columns so child listings are index-only scans
+        Index('idx_ctc_types_class_id', 'class_id',
+              postgresql_include=['id', 'uuid', 'code', 'name', 'store', 'active']),
     )
 
 
@@ -178,8 +233,7 @@ class CTCCategory(Base):
     type_id = Column(
         Integer,
         ForeignKey("ctc_types.id", ondelete="CASCADE"),
-        nullable=False,
-        index=True
+        nullable=False
     )
 
     # Product association (only for categories at level 3)
@@ -212,8 +266,15 @@ class CTCCategory(Base):
         Index('idx_ctc_categories_uuid', 'uuid'),
         Index('idx_ctc_categories_code', 'code'),
         Index('idx_ctc_categories_store', 'store'),
-        Index('idx_ctc_categories_type_id', 'type_id'),
+        # Covers the CategoryView columns so child listings are index-only scans
+        Index('idx_ctc_categories_type_id', 'type_id',
+              postgresql_include=['id', 'uuid', 'code', 'name', 'store', 'active', 'product_id']),
         Index('idx_ctc_categories_product_id', 'product_id'),
+        # Trigram indexes for the ILIKE '%term%' category search
+        Index('idx_ctc_categories_name_trgm', 'name',
+              postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}).ddl_if(dialect='postgresql'),
+        Index('idx_ctc_categories_code_trgm', 'code',
+              postgresql_using='gin', postgresql_ops={'code': 'gin_trgm_ops'}).ddl_if(dialect='postgresql'),
     )
 
 
@@ -394,7 +455,7 @@ class Distributor(Base):
     __tablename__ = "distributors"
 
     id = Column(Integer, primary_key=True)
-    uuid = Column(String, nullable=False, unique=True, default=lambda: str(uuid.uuid4()))
+    uuid = Column(String, nullable=False, unique=True, server_default=gen_random_uuid())
     active = Column(Boolean, nullable=False, default=True)
     modified_by = Column(String, nullable=False)
     modified = Column(DateTime, nullable=False)
@@ -436,7 +497,7 @@ class Brand(Base):
     __tablename__ = "brands"
 
     id = Column(Integer, primary_key=True)
-    uuid = Column(String, nullable=False, unique=True, default=lambda: str(uuid.uuid4()))
+    uuid = Column(String, nullable=False, unique=True, server_default=gen_random_uuid())
     active = Column(Boolean, nullable=False, default=True)
     modified_by = Column(String, nullable=False)
     modified = Column(DateTime, nullable=False)
@@ -477,7 +538,7 @@ class RebateAgreement(Base):
     __tablename__ = "rebate_agreements"
 
     id = Column(Integer, primary_key=True)
-    uuid = Column(String, nullable=False, unique=True, default=lambda: str(uuid.uuid4()))
+    uuid = Column(String, nullable=False, unique=True, server_default=gen_random_uuid())
     agreement_type = Column(
         Enum("vendor", "customer", name="agreement_types"), nullable=False
     )
@@ -506,26 +567,38 @@ class RebateAgreement(Base):
     )
 
     # Relationships
+    # Loaded eagerly with one "WHERE rebate_agreement_id IN (...)" query per
+    # collection, so list endpoints don't join or lazy-load per agreement
     products = relationship(
-        "RebateAgreementProduct", back_populates="agreement", cascade="all, delete-orphan"
+        "RebateAgreementProduct", back_populates="agreement", cascade="all, delete-orphan",
+        lazy="selectin", order_by="RebateAgreementProduct.id",
     )
     tiers = relationship(
-        "RebateTier", back_populates="agreement", cascade="all, delete-orphan"
+        "RebateTier", back_populates="agreement", cascade="all, delete-orphan",
+        lazy="selectin", order_by="RebateTier.id",
     )
     claims = relationship(
         "RebateClaim", back_populates="agreement", cascade="all, delete-orphan"
     )
 
+    # Indexes
+    __table_args__ = (
+        # Equality columns of the overlap check, then both ends of the date range
+        Index('idx_rebate_agreements_overlap', 'distributor_id', 'agreement_type', 'status', 'start_date', 'end_date'),
+    )
+
 
 class RebateAgreementProduct(Base):
     __tablename__ = "rebate_agreement_products"
 
     id = Column(Integer, primary_key=True)
     rebate_agreement_id = Column(
-        Integer, ForeignKey("rebate_agreements.id"), nullable=False
+        Integer, ForeignKey("rebate_agreements.id"), nullable=False, index=True
     )
-    product_id = Column(Integer, ForeignKey("products.id"), nullable=True)
-    category_id = Column(Integer, ForeignKey("ctc_categories.id"), nullable=True)
+    # Indexed for the overlap check's IN filters and for FK checks when a
+    # product or category is deleted
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=True, index=True)
+    category_id = Column(Integer, ForeignKey("ctc_categories.id"), nullable=True, index=True)
 
     # Relationships
     agreement = relationship("RebateAgreement", back_populates="products")
@@ -536,9 +609,9 @@ class RebateTier(Base):
     __tablename__ = "rebate_tiers"
 
     id = Column(Integer, primary_key=True)
-    uuid = Column(String, nullable=False, unique=True, default=lambda: str(uuid.uuid4()))
+    uuid = Column(String, nullable=False, unique=True, server_default=gen_random_uuid())
     rebate_agreement_id = Column(
-        Integer, ForeignKey("rebate_agreements.id"), nullable=False
+        Integer, ForeignKey("rebate_agreements.id"), nullable=False, index=True
     )
     rebate_agreement_uuid = Column(String, nullable=False)
 
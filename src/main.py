@@ -5,7 +5,7 @@ from fastapi.middleware.httpsredirect import HTTPSRedirectMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 
-from .database import init_db
+from .database import init_db, db_session, warm_pool
 from .config import settings
 import logging, yaml
 
@@ -65,10 +65,11 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-app.include_router(products_router)
-app.include_router(analytics_router)
-app.include_router(auth_router)
-app.include_router(rebates_router)
+# One database session per request, shared by every storage call it makes
+app.include_router(products_router, dependencies=[Depends(db_session)])
+app.include_router(analytics_router, dependencies=[Depends(db_session)])
+app.include_router(auth_router, dependencies=[Depends(db_session)])
+app.include_router(rebates_router, dependencies=[Depends(db_session)])
 
 class UserInDB(User):
     hashed_password: str
@@ -132,6 +133,7 @@ async def get_current_active_user(
 @app.on_event("startup")
 async def startup():
     await init_db(load_ctc_data=True)
+    await warm_pool()
 
 
 @app.get("/")
@@ -1,5 +1,5 @@
-from fastapi import APIRouter, HTTPException, Response
-from typing import List
+from fastapi import APIRouter, HTTPException, Query, Response
+from typing import List, Optional
 from ...models import Product, InsertProduct
 from ...storage import storage
 import logging
@@ -13,11 +13,11 @@ async def list_products():
     return await storage.get_products()
 
 @router.get("/search", response_model=List[Product])
-async def search_products(q: str):
+async def search_products(q: str, limit: int = Query(50, ge=1, le=500), after_id: Optional[int] = None):
     logger.info(f"Searching for product: {q}")
     if len(q) < 2:
         return []
-    return await storage.search_products(q)
+    return [product async for product in storage.search_products(q, limit=limit, after_id=after_id)]
 
 @router.get("/{product_code}", response_model=Product)
 async def get_product(product_code: str):
@@ -52,18 +52,28 @@ async def bulk_create(products: List[InsertProduct]):
     logger.info("Starting bulk product upload")
     results: List[Product] = []
     errors: List[str] = []
+    existing = await storage.get_existing_product_codes(data.product_code for data in products)
+    pending: List[InsertProduct] = []
     for data in products:
-        logger.info(f"Uploading {data.product_code}, product data {data}")
-        try:
-            if await storage.get_product_by_code(data.product_code):
-                logger.info(f"Product code already exists {data.product_code}")
-                #TODO add check if attributes are different then update 
-                continue
-            product = await storage.create_product(data)
-            results.append(product)
-        except Exception as e:
-            logger.warning(f"Failed to create product with code {data.product_code} with error {e}")
-            errors.append(data.product_code)
+        if data.product_code in existing:
+            logger.info(f"Product code already exists {data.product_code}")
+            #TODO add check if attributes are different then update 
+            continue
+        existing.add(data.product_code)
+        pending.append(data)
+    try:
+        results = await storage.create_products(pending)
+    except Exception as e:
+        # Fall back to one product at a time so a bad row only fails itself
+        logger.warning(f"Bulk insert failed ({e}), retrying products individually")
+        for data in pending:
+            logger.info(f"Uploading {data.product_code}, product data {data}")
+            try:
+                product = await storage.create_product(data)
+                results.append(product)
+            except Exception as e:
+                logger.warning(f"Failed to create product with code {data.product_code} with error {e}")
+                errors.append(data.product_code)
     return {
         "success": len(results),
         "errors": len(errors),
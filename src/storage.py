@@ -1,105 +1,316 @@
 import asyncio
-from typing import List, Optional, Literal
-from sqlalchemy import select, text
-from sqlalchemy.orm import joinedload
-from .database import get_async_session
-from .db_models import ProductModel, User, PriceLevel, RebateAgreement, RebateAgreementProduct, RebateTier, RebateClaim, CTCCategory
+import functools
+import operator
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from types import UnionType
+from typing import AsyncGenerator, Dict, Iterable, List, Optional, Literal, Tuple, Union, get_args, get_origin
+from cachetools import TTLCache
+from pydantic import BaseModel
+from sqlalchemy import Integer, String, select, insert, update, delete, bindparam, text, func, case, cast, distinct, literal_column, null, or_, union_all
+from sqlalchemy.orm import aliased, lazyload, selectinload
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.dialects.postgresql import distinct_on
+from .database import get_async_readonly_session, get_async_session, get_read_connection
+from .db_models import ProductModel, User, PriceLevel, RebateAgreement, RebateAgreementProduct, RebateTier, RebateClaim, CTCClass, CTCType, CTCCategory, product_search_vector
 from .models import (
     Product,
+    PriceLevel as PriceLevelSchema,
     InsertProduct,
     ProductAnalytics,
     OverallAnalytics,
     RebateAgreementCreate,
     RebateAgreementRead,
     RebateTierCreate,
+    RebateTierRead,
 )
 import logging 
-import uuid
-import json
-import pandas as pd
 from decimal import Decimal
 
 logger = logging.getLogger('uvicorn.error')
 
 
+def _nested_schema(annotation):
+    """(schema, is_list) for a field typed as a schema, Optional or List of one, else None."""
+    many = False
+    while get_origin(annotation) in (Union, UnionType, list, List):
+        if get_origin(annotation) in (list, List):
+            many = True
+        args = [arg for arg in get_args(annotation) if arg is not type(None)]
+        if len(args) != 1:
+            return None
+        annotation = args[0]
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return annotation, many
+    return None
+
+
+@functools.lru_cache(maxsize=None)
+def _schema_builder(schema_cls):
+    """Copy an ORM object's attributes into schema_cls with model_construct.
+    
+    Rows read back from our own tables are already well-typed, so validation
+    is skipped; nested schema fields such as price_levels are built the same way.
+    """
+    names = tuple(schema_cls.model_fields)
+    get_values = operator.attrgetter(*names)
+    nested = {}
+    for name, field in schema_cls.model_fields.items():
+        inner = _nested_schema(field.annotation)
+        if inner is not None:
+            nested[name] = (_schema_builder(inner[0]), inner[1])
+
+    def build(obj):
+        values = get_values(obj)
+        values = dict(zip(names, values if len(names) > 1 else (values,)))
+        for name, (build_nested, many) in nested.items():
+            value = values[name]
+            if value is not None:
+                values[name] = [build_nested(v) for v in value] if many else build_nested(value)
+        return schema_cls.model_construct(**values)
+    return build
+
+
 def to_schema(obj, schema_cls):
-    if hasattr(schema_cls, "model_validate"):
-        logger.debug(f"Model {obj} or {schema_cls}")
-        return schema_cls.model_validate(obj, from_attributes=True)
+    if hasattr(schema_cls, "model_construct"):
+        return _schema_builder(schema_cls)(obj)
     return schema_cls.from_orm(obj)
 
 
+def _as_float(value):
+    """float() for DB Decimals, keeping None (and treating 0 as a value, not as missing)."""
+    return None if value is None else float(value)
+
+
+def _tier_key(from_quantity, to_quantity, from_amount, to_amount, rebate_value, rebate_unit):
+    """Comparable identity for a tier, normalising DB Decimals and request floats alike."""
+    return (
+        _as_float(from_quantity),
+        _as_float(to_quantity),
+        _as_float(from_amount),
+        _as_float(to_amount),
+        _as_float(rebate_value),
+        rebate_unit,
+    )
+
+
+def _search_products_stmt(full_text: bool):
+    q = bindparam("q")
+    match = (
+        (ProductModel.product_name.ilike(q))
+        | (ProductModel.product_code.ilike(q))
+        | (ProductModel.brand_name.ilike(q))
+        | (ProductModel.category_name.ilike(q))
+    )
+    if full_text:
+        # Stemmed full-text match on the GIN-indexed search vector, keeping
+        # the trigram-indexed substring match for partially typed terms
+        ts_query = func.plainto_tsquery(text("'english'"), bindparam("query"))
+        match = product_search_vector.bool_op('@@')(ts_query) | match
+    return (
+        select(ProductModel)
+        .options(selectinload(ProductModel.price_levels))
+        .where(match, ProductModel.id > bindparam("after_id"))
+        .order_by(ProductModel.id)
+        .limit(bindparam("limit"))
+    )
+
+
+# Built once at import; search_products only binds parameters per call
+SEARCH_PRODUCTS_STMT = _search_products_stmt(full_text=False)
+SEARCH_PRODUCTS_FTS_STMT = _search_products_stmt(full_text=True)
+
+
+# Plain column reads for the product endpoints: rows go straight into the
+# schemas without ORM instrumentation or identity-map bookkeeping
+_PRODUCT_READ_COLUMNS = tuple(
+    ProductModel.__table__.c[name] for name in Product.model_fields if name != "price_levels"
+)
+_PRICE_LEVEL_READ_COLUMNS = tuple(
+    PriceLevel.__table__.c[name] for name in PriceLevelSchema.model_fields
+)
+
+
+async def _read_products(session, *criteria) -> List[Product]:
+    stmt = select(ProductModel.id, *_PRODUCT_READ_COLUMNS)
+    if criteria:
+        stmt = stmt.where(*criteria)
+    rows = (await session.execute(stmt)).all()
+    if not rows:
+        return []
+
+    levels_stmt = select(PriceLevel.product_id, *_PRICE_LEVEL_READ_COLUMNS).order_by(PriceLevel.id)
+    if criteria:
+        levels_stmt = levels_stmt.where(PriceLevel.product_id.in_([row.id for row in rows]))
+    levels = defaultdict(list)
+    for level in await session.execute(levels_stmt):
+        levels[level.product_id].append(PriceLevelSchema.model_construct(**level._mapping))
+
+    # Trusted column values, so construct without re-validating (see _schema_builder)
+    return [
+        Product.model_construct(**row._mapping, price_levels=levels[row.id])
+        for row in rows
+    ]
+
+
+def _first_trade_value(dialect_name: str):
+    """(value, from clause) giving each product's first Trade value_excl, NULL if it has none."""
+    if dialect_name == "postgresql":
+        # DISTINCT ON keeps one Trade row per product in a single pass
+        trade = (
+            select(PriceLevel.product_id, PriceLevel.value_excl)
+            .where(PriceLevel.price_level == "Trade")
+            .ext(distinct_on(PriceLevel.product_id))
+            .order_by(PriceLevel.product_id, PriceLevel.id)
+            .subquery()
+        )
+        return trade.c.value_excl, ProductModel.__table__.outerjoin(trade, trade.c.product_id == ProductModel.id)
+    trade_value = (
+        select(PriceLevel.value_excl)
+        .where(
+            PriceLevel.product_id == ProductModel.id,
+            PriceLevel.price_level == "Trade",
+        )
+        .order_by(PriceLevel.id)
+        .limit(1)
+        .scalar_subquery()
+    )
+    return trade_value, ProductModel.__table__
+
+
 class SQLStorage:
     # Product operations
     async def get_products(self) -> List[Product]:
-        async with get_async_session() as session:
-            result = await session.execute(select(ProductModel))
-            return [to_schema(row, Product) for row in result.scalars().all()]
+        async with get_async_readonly_session() as session:
+            return await _read_products(session)
 
     async def get_product(self, pid: int) -> Optional[Product]:
-        async with get_async_session() as session:
-            result = await session.get(ProductModel, pid)
-            return to_schema(result, Product) if result else None
+        async with get_async_readonly_session() as session:
+            products = await _read_products(session, ProductModel.id == pid)
+            return products[0] if products else None
 
     async def get_product_by_code(self, code: str) -> Optional[Product]:
-        async with get_async_session() as session:
-            stmt = select(ProductModel).where(ProductModel.product_code == code)
-            result = await session.execute(stmt)
-            row = result.scalar_one_or_none()
-            return to_schema(row, Product) if row else None
+        async with get_async_readonly_session() as session:
+            products = await _read_products(session, ProductModel.product_code == code)
+            return products[0] if products else None
     
     async def get_product_by_uuid(self, uuid: str) -> Optional[Product]:
-        async with get_async_session() as session:
-            stmt = select(ProductModel).where(ProductModel.uuid == uuid)
-            result = await session.execute(stmt)
-            row = result.scalar_one_or_none()
-            return to_schema(row, Product) if row else None
+        async with get_async_readonly_session() as session:
+            products = await _read_products(session, ProductModel.uuid == uuid)
+            return products[0] if products else None
 
-    async def search_products(self, query: str) -> List[Product]:
+    async def search_products(
+        self, query: str, limit: int = 50, after_id: Optional[int] = None
+    ) -> AsyncGenerator[Product, None]:
+        """Stream one page of matching products, ordered by id.
+        
+        Pass the id of the last product received as ``after_id`` to fetch the
+        next page (keyset pagination, so later pages cost no OFFSET scan).
+        """
         q = f"%{query.lower()}%"
         logger.info(f"Printing query {q}")
         async with get_async_session() as session:
-            stmt = select(ProductModel).where(
-                (ProductModel.product_name.ilike(q))
-                | (ProductModel.product_code.ilike(q))
-                | (ProductModel.brand_name.ilike(q))
-                | (ProductModel.category_name.ilike(q))
-            )
-            result = await session.execute(stmt)
-            return [to_schema(p, Product) for p in result.scalars().all()]
+            if session.bind.dialect.name == "postgresql":
+                stmt = SEARCH_PRODUCTS_FTS_STMT
+            else:
+                stmt = SEARCH_PRODUCTS_STMT
+            # Product ids start at 1, so 0 means "from the first page"
+            params = {"q": q, "query": query, "after_id": after_id or 0, "limit": limit}
+            async for p in await session.stream_scalars(stmt, params):
+                yield to_schema(p, Product)
 
     async def create_product(self, data: InsertProduct) -> Product:
         async with get_async_session() as session:
             product_data = data.dict()
             price_levels_data = product_data.pop('price_levels', [])
-            product_data['uuid'] = str(uuid.uuid4())
             
-            # Create the product
-            obj = ProductModel(**product_data)
-            session.add(obj)
-            await session.flush()  # Flush to get the product ID
-            
-            # Create price levels
-            for price_level_data in price_levels_data:
-                price_level = PriceLevel(
-                    product_id=obj.id,
-                    **price_level_data
+            try:
+                # Create the product, reading generated columns back via RETURNING
+                obj = await session.scalar(
+                    insert(ProductModel).values(**product_data).returning(ProductModel)
                 )
-                session.add(price_level)
-            
-            await session.commit()
-            await session.refresh(obj)
+                
+                # Create price levels
+                price_levels = []
+                if price_levels_data:
+                    price_levels = (await session.scalars(
+                        insert(PriceLevel).returning(PriceLevel),
+                        [{"product_id": obj.id, **price_level_data} for price_level_data in price_levels_data],
+                    )).all()
+                set_committed_value(obj, "price_levels", list(price_levels))
+                
+                await session.commit()
+            except Exception:
+                # Leave a shared request session usable for the caller's next write
+                await session.rollback()
+                raise
             return to_schema(obj, Product)
 
+    async def create_products(self, data: List[InsertProduct]) -> List[Product]:
+        """Create several products in one transaction: one INSERT for the products
+        and one for all of their price levels."""
+        if not data:
+            return []
+        async with get_async_session() as session:
+            try:
+                products_data = [item.dict() for item in data]
+                price_levels_data = [product_data.pop('price_levels', []) for product_data in products_data]
+                
+                # RETURNING rows aren't guaranteed to follow parameter order without
+                # sort_by_parameter_order, which costs batching on some backends;
+                # product_code is unique, so match rows back by it instead
+                returned = (await session.scalars(
+                    insert(ProductModel).returning(ProductModel), products_data
+                )).all()
+                by_code = {obj.product_code: obj for obj in returned}
+                objs = [by_code[product_data['product_code']] for product_data in products_data]
+                
+                price_level_rows = [
+                    {"product_id": obj.id, **price_level_data}
+                    for obj, levels in zip(objs, price_levels_data)
+                    for price_level_data in levels
+                ]
+                levels_by_product = defaultdict(list)
+                if price_level_rows:
+                    for price_level in await session.scalars(
+                        insert(PriceLevel).returning(PriceLevel), price_level_rows
+                    ):
+                        levels_by_product[price_level.product_id].append(price_level)
+                for obj in objs:
+                    levels = sorted(levels_by_product[obj.id], key=lambda price_level: price_level.id)
+                    set_committed_value(obj, "price_levels", levels)
+                
+                await session.commit()
+            except Exception:
+                await session.rollback()
+                raise
+            return [to_schema(obj, Product) for obj in objs]
+
+    async def get_existing_product_codes(self, codes: Iterable[str]) -> set:
+        async with get_async_readonly_session() as session:
+            result = await session.scalars(
+                select(ProductModel.product_code).where(ProductModel.product_code.in_(set(codes)))
+            )
+            return set(result)
+
     async def update_product(self, pid: int, data: dict) -> Optional[Product]:
         async with get_async_session() as session:
-            obj = await session.get(ProductModel, pid)
+            if not data:
+                obj = await session.get(
+                    ProductModel, pid, options=[selectinload(ProductModel.price_levels)]
+                )
+                return to_schema(obj, Product) if obj else None
+            obj = await session.scalar(
+                update(ProductModel)
+                .where(ProductModel.id == pid)
+                .values(**data)
+                .returning(ProductModel)
+                .options(selectinload(ProductModel.price_levels))
+            )
             if not obj:
                 return None
-            for k, v in data.items():
-                setattr(obj, k, v)
             await session.commit()
-            await session.refresh(obj)
             return to_schema(obj, Product)
 
     async def delete_product(self, pid: int) -> bool:
@@ -121,49 +332,53 @@ class SQLStorage:
         self, product_code: Optional[int] = None
     ) -> List[ProductAnalytics]:
         async with get_async_session() as session:
-            prod_stmt = select(ProductModel)
+            # First Trade price level per product, resolved by the database
+            trade_value, source = _first_trade_value(session.bind.dialect.name)
+            prod_stmt = select(
+                ProductModel.id,
+                ProductModel.product_name,
+                ProductModel.product_code,
+                ProductModel.brand_name,
+                trade_value,
+            ).select_from(source).order_by(ProductModel.product_name)
             if product_code is not None:
                 prod_stmt = prod_stmt.where(ProductModel.id == product_code)
-            products = (await session.execute(prod_stmt)).scalars().all()
-            analytics: List[ProductAnalytics] = []
-            for p in products:
-                # Calculate total revenue from price levels (using Trade price level if available)
-                total_revenue = Decimal('0.0')
-                for price_level in p.price_levels:
-                    if price_level.price_level == "Trade":
-                        total_revenue = price_level.value_excl
-                        break
-                
-                analytics.append(
-                    ProductAnalytics(
-                        product_id=p.id,
-                        product_name=p.product_name,
-                        product_code=p.product_code,
-                        brand_name=p.brand_name,
-                        turnover_rate=0.0,  # TODO: Calculate from deals data
-                        total_revenue=total_revenue,  # Calculate from price levels
-                        current_stock=0,  # TODO: Get from inventory data
-                    )
+            rows = (await session.execute(prod_stmt)).all()
+            return [
+                ProductAnalytics(
+                    product_id=pid,
+                    product_name=product_name,
+                    product_code=code,
+                    brand_name=brand_name,
+                    turnover_rate=0.0,  # TODO: Calculate from deals data
+                    total_revenue=revenue if revenue is not None else Decimal('0.0'),  # Calculate from price levels
+                    current_stock=0,  # TODO: Get from inventory data
                 )
-            analytics.sort(key=lambda a: a.product_name)
-            return analytics
+                for pid, product_name, code, brand_name, revenue in rows
+            ]
 
     async def get_overall_analytics(self) -> OverallAnalytics:
         async with get_async_session() as session:
-            products = (await session.execute(select(ProductModel))).scalars().all()
-            total_products = len(products)
-            active_products = len([p for p in products if p.status == 'Active'])
-            total_brands = len(set(p.brand_name for p in products))
-            total_categories = len(set(p.category_name for p in products))
-            total_distributors = len(set(p.distributor_name for p in products))
-            
-            # Calculate total revenue from price levels
-            total_revenue = Decimal('0.0')
-            for p in products:
-                for price_level in p.price_levels:
-                    if price_level.price_level == "Trade":
-                        total_revenue += price_level.value_excl
-                        break
+            # Sum each product's first Trade value, as get_product_analytics
+            # reports it; the source yields one row per product, so the
+            # counts are not multiplied
+            trade_value, source = _first_trade_value(session.bind.dialect.name)
+            stmt = select(
+                func.count(ProductModel.id),
+                func.coalesce(func.sum(case((ProductModel.status == 'Active', 1), else_=0)), 0),
+                func.count(distinct(ProductModel.brand_name)),
+                func.count(distinct(ProductModel.category_name)),
+                func.count(distinct(ProductModel.distributor_name)),
+                func.coalesce(func.sum(trade_value), 0),
+            ).select_from(source)
+            (
+                total_products,
+                active_products,
+                total_brands,
+                total_categories,
+                total_distributors,
+                total_revenue,
+            ) = (await session.execute(stmt)).one()
             
             return OverallAnalytics(
                 average_turnover_rate=0.0,  # TODO: Calculate from deals data
@@ -183,10 +398,8 @@ class SQLStorage:
     
     async def create_user(self, data: User) -> User:
         async with get_async_session() as session:
-            obj = User(**data.dict())
-            session.add(obj)
+            obj = await session.scalar(insert(User).values(**data.dict()).returning(User))
             await session.commit()
-            await session.refresh(obj)
             return to_schema(obj, User)
 
     # Rebate operations
@@ -211,40 +424,27 @@ class SQLStorage:
             agreement_data = data.dict()
             products = agreement_data.pop('products', [])
             product_category_ids = agreement_data.pop('product_category_ids', [])
-            tiers = agreement_data.pop('tiers', [])
-            
-            # Generate UUID for agreement
-            agreement_data['uuid'] = str(uuid.uuid4())
-            agreement = RebateAgreement(**agreement_data)
-            session.add(agreement)
-            await session.flush()  # Get the agreement ID and UUID
+            agreement_data.pop('tiers', None)
             
-            # Create product associations
-            for product_id in products:
-                product_assoc = RebateAgreementProduct(
-                    rebate_agreement_id=agreement.id,
-                    product_id=product_id
-                )
-                session.add(product_assoc)
-            
-            # Create category associations
-            for category_id in product_category_ids:
-                category_assoc = RebateAgreementProduct(
-                    rebate_agreement_id=agreement.id,
-                    category_id=category_id
-                )
-                session.add(category_assoc)
+            agreement = await session.scalar(
+                insert(RebateAgreement)
+                .values(**agreement_data)
+                .returning(RebateAgreement)
+                # Nothing to load yet; the collections are filled in below
+                .options(lazyload(RebateAgreement.products), lazyload(RebateAgreement.tiers))
+            )
             
-            # Create tiers with UUIDs and parent agreement UUID
-            for tier_data in tiers:
-                tier = self._create_tier_from_data(tier_data, agreement.id, agreement.uuid, data.basis)
-                session.add(tier)
+            # Create product/category associations and tiers
+            links, tiers = await self._add_agreement_links(
+                session, agreement, products, product_category_ids, data.tiers, data.basis
+            )
+            set_committed_value(agreement, "products", links)
+            set_committed_value(agreement, "tiers", tiers)
             
             await session.commit()
-            await session.refresh(agreement)
             
             # Return the created agreement with all related data
-            return await self._build_rebate_agreement_response(session, agreement)
+            return self._build_rebate_agreement_response(agreement)
     
     async def get_rebate_agreements(
         self, 
@@ -253,89 +453,75 @@ class SQLStorage:
         status: Optional[str] = None
     ) -> List[RebateAgreementRead]:
         """Get rebate agreements with optional filtering."""
-        async with get_async_session() as session:
+        async with get_async_readonly_session() as session:
             stmt = select(RebateAgreement)
             
             if agreement_type:
                 stmt = stmt.where(RebateAgreement.agreement_type == agreement_type)
             if distributor_id:
-                stmt = stmt.where(RebateAgreement.party_id == distributor_id)
+                stmt = stmt.where(RebateAgreement.distributor_id == distributor_id)
             if status:
                 stmt = stmt.where(RebateAgreement.status == status)
             
             agreements = (await session.execute(stmt)).scalars().all()
-            return [await self._build_rebate_agreement_response(session, agreement) for agreement in agreements]
+            return [self._build_rebate_agreement_response(agreement) for agreement in agreements]
     
     async def get_rebate_agreement(self, agreement_id: int) -> Optional[RebateAgreementRead]:
         """Get a specific rebate agreement by ID."""
-        async with get_async_session() as session:
+        async with get_async_readonly_session() as session:
             agreement = await session.get(RebateAgreement, agreement_id)
             if not agreement:
                 return None
-            return await self._build_rebate_agreement_response(session, agreement)
+            return self._build_rebate_agreement_response(agreement)
     
     async def update_rebate_agreement(self, agreement_id: int, data: RebateAgreementCreate) -> Optional[RebateAgreementRead]:
         """Update an existing rebate agreement."""
         async with get_async_session() as session:
-            agreement = await session.get(RebateAgreement, agreement_id)
-            if not agreement:
-                return None
-            
             # Validate input
-            if not data.products and not data.product_category_ids:
-                raise ValueError("At least one product or product category must be specified")
-            
-            if data.start_date >= data.end_date:
-                raise ValueError("Start date must be before end date")
-            
-            # Validate tier ranges if provided
-            if data.tiers:
-                self._validate_tier_ranges(data.tiers, data.basis)
+            try:
+                if not data.products and not data.product_category_ids:
+                    raise ValueError("At least one product or product category must be specified")
+                
+                if data.start_date >= data.end_date:
+                    raise ValueError("Start date must be before end date")
+                
+                # Validate tier ranges if provided
+                if data.tiers:
+                    self._validate_tier_ranges(data.tiers, data.basis)
+            except ValueError:
+                # An unknown agreement is "not found" whatever the payload
+                exists = await session.scalar(
+                    select(RebateAgreement.id).where(RebateAgreement.id == agreement_id)
+                )
+                if exists is None:
+                    return None
+                raise
             
             # Update agreement fields
             agreement_data = data.dict()
             products = agreement_data.pop('products', [])
             product_category_ids = agreement_data.pop('product_category_ids', [])
-            tiers = agreement_data.pop('tiers', [])
-            
-            for key, value in agreement_data.items():
-                setattr(agreement, key, value)
+            agreement_data.pop('tiers', None)
             
-            # Clear existing associations and tiers
-            await session.execute(
-                text("DELETE FROM rebate_agreement_products WHERE rebate_agreement_id = :id"),
-                {"id": agreement_id}
-            )
-            await session.execute(
-                text("DELETE FROM rebate_tiers WHERE rebate_agreement_id = :id"),
-                {"id": agreement_id}
+            agreement = await session.scalar(
+                update(RebateAgreement)
+                .where(RebateAgreement.id == agreement_id)
+                .values(**agreement_data)
+                .returning(RebateAgreement)
             )
+            if not agreement:
+                return None
             
-            # Create new product associations
-            for product_id in products:
-                product_assoc = RebateAgreementProduct(
-                    rebate_agreement_id=agreement.id,
-                    product_id=product_id
-                )
-                session.add(product_assoc)
-            
-            # Create new category associations
-            for category_id in product_category_ids:
-                category_assoc = RebateAgreementProduct(
-                    rebate_agreement_id=agreement.id,
-                    category_id=category_id
-                )
-                session.add(category_assoc)
-            
-            # Create new tiers with UUIDs and parent agreement UUID
-            for tier_data in tiers:
-                tier = self._create_tier_from_data(tier_data, agreement.id, agreement.uuid, data.basis)
-                session.add(tier)
+            # Only add/remove the associations and tiers that actually changed
+            links, tiers = await self._sync_agreement_links(
+                session, agreement, products, product_category_ids, data.tiers, data.basis
+            )
+            set_committed_value(agreement, "products", links)
+            set_committed_value(agreement, "tiers", tiers)
             
             await session.commit()
-            await session.refresh(agreement)
             
-            return await self._build_rebate_agreement_response(session, agreement)
+            return self._build_rebate_agreement_response(agreement)
     
     async def delete_rebate_agreement(self, agreement_id: int) -> bool:
         """Delete a rebate agreement."""
@@ -352,71 +538,185 @@ class SQLStorage:
         if not tiers:
             return
         
-        # Sort tiers by from_value
-        sorted_tiers = sorted(tiers, key=lambda t: t.from_quantity or t.from_amount or 0)
+        # Pull each tier's (from, to) bounds for the basis once, then check
+        # them in from order against the previous tier's upper bound
+        if basis == "quantity":
+            bounds = [(tier.from_quantity, tier.to_quantity) for tier in tiers]
+        else:
+            bounds = [(tier.from_amount, tier.to_amount) for tier in tiers]
+        bounds.sort(key=lambda bound: bound[0] or 0)
         
-        for i, tier in enumerate(sorted_tiers):
+        prev_to_val = None
+        for i, (from_val, to_val) in enumerate(bounds, 1):
             # Check that from_value is less than to_value
-            from_val = tier.from_quantity if basis == "quantity" else tier.from_amount
-            to_val = tier.to_quantity if basis == "quantity" else tier.to_amount
-            
             if from_val is not None and to_val is not None and from_val >= to_val:
-                raise ValueError(f"Tier {i+1}: from_value must be less than to_value")
+                raise ValueError(f"Tier {i}: from_value must be less than to_value")
             
             # Check for overlaps with previous tier
-            if i > 0:
-                prev_tier = sorted_tiers[i-1]
-                prev_to_val = prev_tier.to_quantity if basis == "quantity" else prev_tier.to_amount
-                
-                if prev_to_val is not None and from_val is not None and prev_to_val > from_val:
-                    raise ValueError(f"Tier {i+1} overlaps with previous tier")
-    
-    def _create_tier_from_data(self, tier_data: RebateTierCreate, agreement_id: int, agreement_uuid: str, basis: str) -> RebateTier:
-        """Create a RebateTier database object from tier data, including UUIDs."""
-        tier_dict = tier_data.dict()
-        tier_dict['uuid'] = str(uuid.uuid4())
-        tier_dict['rebate_agreement_uuid'] = agreement_uuid
-        # Map rebate_value and rebate_unit to database fields
-        tier_dict['rebate_value'] = tier_dict.pop('rebate_value')
-        tier_dict['rebate_unit'] = tier_dict.pop('rebate_unit')
-        # Set the appropriate from/to fields based on basis
-        if basis == "quantity":
-            tier_dict['from_quantity'] = tier_dict.pop('from_quantity')
-            tier_dict['to_quantity'] = tier_dict.pop('to_quantity')
-            tier_dict['from_amount'] = None
-            tier_dict['to_amount'] = None
-        else:  # amount
-            tier_dict['from_amount'] = tier_dict.pop('from_amount')
-            tier_dict['to_amount'] = tier_dict.pop('to_amount')
-            tier_dict['from_quantity'] = None
-            tier_dict['to_quantity'] = None
-        tier_dict['rebate_agreement_id'] = agreement_id
-        return RebateTier(**tier_dict)
+            if prev_to_val is not None and from_val is not None and prev_to_val > from_val:
+                raise ValueError(f"Tier {i} overlaps with previous tier")
+            prev_to_val = to_val
+    
+    async def _add_agreement_links(
+        self,
+        session,
+        agreement: RebateAgreement,
+        products: List[int],
+        product_category_ids: List[int],
+        tiers: List[RebateTierCreate],
+        basis: str,
+    ):
+        """Insert an agreement's product/category associations and tiers in batches.
+        
+        Returns the inserted association and tier objects.
+        """
+        assoc_rows = [
+            {"rebate_agreement_id": agreement.id, "product_id": product_id, "category_id": None}
+            for product_id in products
+        ] + [
+            {"rebate_agreement_id": agreement.id, "product_id": None, "category_id": category_id}
+            for category_id in product_category_ids
+        ]
+        links = []
+        if assoc_rows:
+            # One executemany instead of an INSERT per association
+            links = (await session.scalars(
+                insert(RebateAgreementProduct).returning(RebateAgreementProduct), assoc_rows
+            )).all()
+        
+        # Tiers with the parent agreement UUID, inserted together
+        new_tiers = []
+        if tiers:
+            new_tiers = (await session.scalars(
+                insert(RebateTier).returning(RebateTier),
+                [
+                    self._create_tier_from_data(tier_data, agreement.id, agreement.uuid, basis)
+                    for tier_data in tiers
+                ],
+            )).all()
+        return list(links), list(new_tiers)
+    
+    async def _sync_agreement_links(
+        self,
+        session,
+        agreement: RebateAgreement,
+        products: List[int],
+        product_category_ids: List[int],
+        tiers: List[RebateTierCreate],
+        basis: str,
+    ):
+        """Diff an agreement's associations and tiers against the request and apply only the changes.
+        
+        Returns the agreement's resulting association and tier objects.
+        """
+        # Associations are identified by their (product_id, category_id) pair
+        wanted_assocs = {(product_id, None) for product_id in products}
+        wanted_assocs |= {(None, category_id) for category_id in product_category_ids}
+        kept_assocs = {}
+        stale_assoc_ids = []
+        for assoc in agreement.products:
+            key = (assoc.product_id, assoc.category_id)
+            if key in wanted_assocs and key not in kept_assocs:
+                kept_assocs[key] = assoc
+            else:
+                stale_assoc_ids.append(assoc.id)
+        
+        # Tiers carry no client-side identity, so an unchanged tier is one
+        # whose thresholds, value and unit all match an existing row
+        unmatched_tiers = defaultdict(list)
+        for tier in agreement.tiers:
+            unmatched_tiers[_tier_key(
+                tier.from_quantity, tier.to_quantity, tier.from_amount, tier.to_amount,
+                tier.rebate_value, tier.rebate_unit,
+            )].append(tier)
+        kept_tiers = []
+        new_tiers = []
+        for tier_data in tiers:
+            if basis == "quantity":
+                key = _tier_key(tier_data.from_quantity, tier_data.to_quantity, None, None,
+                                tier_data.rebate_value, tier_data.rebate_unit)
+            else:
+                key = _tier_key(None, None, tier_data.from_amount, tier_data.to_amount,
+                                tier_data.rebate_value, tier_data.rebate_unit)
+            if unmatched_tiers[key]:
+                kept_tiers.append(unmatched_tiers[key].pop(0))
+            else:
+                new_tiers.append(tier_data)
+        stale_tier_ids = [tier.id for stale in unmatched_tiers.values() for tier in stale]
+        
+        delete_links = delete(RebateAgreementProduct).where(RebateAgreementProduct.id.in_(stale_assoc_ids))
+        delete_tiers = delete(RebateTier).where(RebateTier.id.in_(stale_tier_ids))
+        if stale_assoc_ids and stale_tier_ids and session.bind.dialect.name == "postgresql":
+            # PostgreSQL runs a data-modifying CTE even when it isn't referenced,
+            # so both deletes go out as one statement
+            await session.execute(delete_tiers.add_cte(delete_links.cte("stale_links")))
+        else:
+            if stale_assoc_ids:
+                await session.execute(delete_links)
+            if stale_tier_ids:
+                await session.execute(delete_tiers)
+        
+        added_links, added_tiers = await self._add_agreement_links(
+            session,
+            agreement,
+            [pid for pid in dict.fromkeys(products) if (pid, None) not in kept_assocs],
+            [cid for cid in dict.fromkeys(product_category_ids) if (None, cid) not in kept_assocs],
+            new_tiers,
+            basis,
+        )
+        kept_tiers.sort(key=lambda tier: tier.id)
+        return list(kept_assocs.values()) + added_links, kept_tiers + added_tiers
+    
+    def _create_tier_from_data(self, tier_data: RebateTierCreate, agreement_id: int, agreement_uuid: str, basis: str) -> dict:
+        """Create a rebate_tiers row from tier data; the tier UUID is generated by the database."""
+        # Only the bounds for the agreement's basis are kept; the others are cleared
+        by_quantity = basis == "quantity"
+        return {
+            "rebate_agreement_id": agreement_id,
+            "rebate_agreement_uuid": agreement_uuid,
+            "rebate_value": tier_data.rebate_value,
+            "rebate_unit": tier_data.rebate_unit,
+            "from_quantity": tier_data.from_quantity if by_quantity else None,
+            "to_quantity": tier_data.to_quantity if by_quantity else None,
+            "from_amount": None if by_quantity else tier_data.from_amount,
+            "to_amount": None if by_quantity else tier_data.to_amount,
+        }
     
     async def _check_overlapping_agreements(self, session, data: RebateAgreementCreate):
         """Check for overlapping agreements for the same distributor and products."""
         # This is a simplified check - in a real implementation, you might want more sophisticated logic
-        stmt = select(RebateAgreement).where(
-            RebateAgreement.party_id == data.distributor_id,
-            RebateAgreement.agreement_type == data.agreement_type,
-            RebateAgreement.status == "active"
-        )
-        
-        existing_agreements = (await session.execute(stmt)).scalars().all()
+        overlapping_targets = []
+        if data.products:
+            overlapping_targets.append(RebateAgreementProduct.product_id.in_(data.products))
+        if data.product_category_ids:
+            overlapping_targets.append(RebateAgreementProduct.category_id.in_(data.product_category_ids))
+        if not overlapping_targets:
+            return
         
-        for existing in existing_agreements:
-            # Check if date ranges overlap
-            if (data.start_date <= existing.end_date and data.end_date >= existing.start_date):
-                # Check if products overlap
-                existing_products = [p.product_id for p in existing.products if p.product_id]
-                existing_categories = [p.category_id for p in existing.products if p.category_id]
-                
-                if (set(data.products) & set(existing_products) or 
-                    set(data.product_category_ids) & set(existing_categories)):
-                    raise ValueError(f"Overlapping agreement found: {existing.description}")
+        # Date range and product/category overlap are both resolved in one query
+        stmt = (
+            select(RebateAgreement.description)
+            .join(RebateAgreementProduct, RebateAgreementProduct.rebate_agreement_id == RebateAgreement.id)
+            .where(
+                RebateAgreement.distributor_id == data.distributor_id,
+                RebateAgreement.agreement_type == data.agreement_type,
+                RebateAgreement.status == "active",
+                RebateAgreement.start_date <= data.end_date,
+                RebateAgreement.end_date >= data.start_date,
+                or_(*overlapping_targets),
+            )
+            .limit(1)
+        )
+        existing_description = await session.scalar(stmt)
+        if existing_description is not None:
+            raise ValueError(f"Overlapping agreement found: {existing_description}")
     
-    async def _build_rebate_agreement_response(self, session, agreement: RebateAgreement) -> RebateAgreementRead:
-        """Build a complete RebateAgreementRead response with all related data."""
+    def _build_rebate_agreement_response(self, agreement: RebateAgreement) -> RebateAgreementRead:
+        """Build a complete RebateAgreementRead response with all related data.
+        
+        Reads only the already-loaded products and tiers collections (selectin
+        relationships), so it issues no queries of its own.
+        """
         # Get product IDs
         product_ids = []
         category_ids = []
@@ -426,27 +726,29 @@ class SQLStorage:
             if product_assoc.category_id:
                 category_ids.append(product_assoc.category_id)
         
-        # Build tier responses
-        tiers = []
-        for tier in agreement.tiers:
-            tier_response = RebateTierRead(
+        # Build tier responses; the values come from our own columns, so the
+        # schemas are constructed without re-validation
+        tiers = [
+            RebateTierRead.model_construct(
                 id=tier.id,
                 uuid=tier.uuid,
                 agreement_id=tier.rebate_agreement_id,
                 rebate_agreement_uuid=tier.rebate_agreement_uuid,
                 rebate_value=float(tier.rebate_value),
                 rebate_unit=tier.rebate_unit,
-                from_quantity=float(tier.from_quantity) if tier.from_quantity else None,
-                to_quantity=float(tier.to_quantity) if tier.to_quantity else None,
-                from_amount=float(tier.from_amount) if tier.from_amount else None,
-                to_amount=float(tier.to_amount) if tier.to_amount else None,
+                from_quantity=_as_float(tier.from_quantity),
+                to_quantity=_as_float(tier.to_quantity),
+                from_amount=_as_float(tier.from_amount),
+                to_amount=_as_float(tier.to_amount),
             )
-            tiers.append(tier_response)
+            for tier in agreement.tiers
+        ]
         
-        return RebateAgreementRead(
+        return RebateAgreementRead.model_construct(
             id=agreement.id,
+            uuid=agreement.uuid,
             agreement_type=agreement.agreement_type,
-            distributor_id=agreement.party_id,  # Map party_id back to distributor_id
+            distributor_id=agreement.distributor_id,
             description=agreement.description,
             start_date=agreement.start_date,
             end_date=agreement.end_date,
@@ -460,170 +762,286 @@ class SQLStorage:
             status=agreement.status
         )
 
+# CTC reference data changes only when the CTC import runs, so hierarchy reads
+# are served from memory for up to CTC_CACHE_TTL seconds
+CTC_CACHE_TTL = 300
+
+# The CTC hierarchy is a fixed three levels, each stored in its own table
+CTC_LEVEL_MODELS = {1: CTCClass, 2: CTCType, 3: CTCCategory}
+# The column pointing a level's rows at their parent one level up
+CTC_PARENT_KEYS = {2: CTCType.class_id, 3: CTCCategory.type_id}
+
+# Nodes read outside the snapshot, one cache per lookup key so a fetch by any
+# key serves the others. Ids and codes are only unique within a level, so the
+# keys are (level, value).
+_category_caches = {
+    key: TTLCache(maxsize=4096, ttl=CTC_CACHE_TTL) for key in ("id", "code")
+}
+
+
+# Node uuid -> (level, id), so uuid-keyed reads can reuse the id-keyed queries
+_category_id_by_uuid = TTLCache(maxsize=4096, ttl=CTC_CACHE_TTL)
+
+
+@dataclass(frozen=True, slots=True)
+class CategoryView:
+    """Read-only snapshot of a CTC class, type or category row, without ORM instrumentation."""
+    id: int
+    uuid: str
+    code: str
+    name: str
+    store: str
+    active: bool
+    level: int
+    parent_id: Optional[int]
+    parent_uuid: Optional[str]
+    product_id: Optional[int]
+    children: Tuple["CategoryView", ...] = ()
+
+
+@functools.lru_cache(maxsize=None)
+def _category_view_select(level: int):
+    """SELECT the CategoryView columns of one level, joined to the parent for its uuid."""
+    model = CTC_LEVEL_MODELS[level]
+    # Labelled so compound selects can ORDER BY them
+    columns = [
+        model.id.label("id"),
+        model.uuid,
+        model.code,
+        model.name,
+        model.store,
+        model.active,
+        literal_column(str(level)).label("level"),
+    ]
+    if level == 1:
+        return select(
+            *columns,
+            cast(null(), Integer).label("parent_id"),
+            cast(null(), String).label("parent_uuid"),
+            cast(null(), Integer).label("product_id"),
+        )
+    parent = CTC_LEVEL_MODELS[level - 1]
+    parent_key = CTC_PARENT_KEYS[level]
+    product_id = model.product_id if level == 3 else cast(null(), Integer)
+    return (
+        select(
+            *columns,
+            parent_key.label("parent_id"),
+            parent.uuid.label("parent_uuid"),
+            product_id.label("product_id"),
+        )
+        .join(parent, parent.id == parent_key)
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def _category_view_stmt(level: int, column_name: str):
+    """SELECT a level's CategoryView WHERE <unique column> = :value, built once per level and column."""
+    model = CTC_LEVEL_MODELS[level]
+    # The lookup columns are unique, so stop at the first row
+    return _category_view_select(level).where(
+        getattr(model, column_name) == bindparam("value")
+    ).limit(1)
+
+
+@functools.lru_cache(maxsize=None)
+def _category_children_stmt(level: int):
+    """SELECT the children of a level-``level`` node WHERE parent key = :value."""
+    child_level = level + 1
+    return (
+        _category_view_select(child_level)
+        .where(CTC_PARENT_KEYS[child_level] == bindparam("value"))
+        .order_by(CTC_LEVEL_MODELS[child_level].id)
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def _category_locate_stmt():
+    """SELECT (level, id) of the node with uuid = :value, whichever table holds it."""
+    return union_all(*(
+        select(literal_column(str(level)), model.id).where(model.uuid == bindparam("value"))
+        for level, model in CTC_LEVEL_MODELS.items()
+    )).limit(1)
+
+
+def _ancestor_select(ancestor: int, level: int):
+    """SELECT the level-``ancestor`` node above (or at) the level-``level`` node with id = :value.
+    
+    The hierarchy has a fixed depth, so this joins down through the tables in
+    between instead of recursing.
+    """
+    stmt = _category_view_select(ancestor)
+    for lower in range(ancestor + 1, level + 1):
+        stmt = stmt.join(
+            CTC_LEVEL_MODELS[lower],
+            CTC_PARENT_KEYS[lower] == CTC_LEVEL_MODELS[lower - 1].id,
+        )
+    return stmt.where(CTC_LEVEL_MODELS[level].id == bindparam("value"))
+
+
+@functools.lru_cache(maxsize=None)
+def _category_path_stmt(level: int, include_self: bool = True):
+    """SELECT a node's ancestors, and the node itself unless excluded, root first."""
+    last = level if include_self else level - 1
+    return union_all(*(
+        _ancestor_select(ancestor, level) for ancestor in range(1, last + 1)
+    )).order_by("level")
+
+
+@functools.lru_cache(maxsize=None)
+def _category_subtree_stmt(level: int):
+    """SELECT every descendant of a level-``level`` node with id = :value, level by level.
+    
+    Every level below holds a pointer to its parent, and the view select joins
+    that parent in, so one hop covers a class's categories too.
+    """
+    parent_key = CTC_PARENT_KEYS[level + 1]
+    return union_all(*(
+        _category_view_select(lower).where(parent_key == bindparam("value"))
+        for lower in range(level + 1, len(CTC_LEVEL_MODELS) + 1)
+    )).order_by("level", "id")
+
+
+class _CategoryTree:
+    """Process-local snapshot of the whole CTC hierarchy, indexed for the hierarchy reads."""
+    
+    def __init__(self, rows_by_level):
+        self.loaded_at = time.monotonic()
+        self.by_key = {level: {"id": {}, "code": {}} for level in CTC_LEVEL_MODELS}
+        self.by_uuid = {}
+        # Leaves first, so every node is built with its children already made
+        children = defaultdict(list)
+        for level in sorted(rows_by_level, reverse=True):
+            for row in rows_by_level[level]:
+                category = CategoryView(*row, children=tuple(children.pop((level, row.id), ())))
+                self.by_key[level]["id"][category.id] = category
+                self.by_key[level]["code"][category.code] = category
+                self.by_uuid[category.uuid] = category
+                if category.parent_id is not None:
+                    children[(level - 1, category.parent_id)].append(category)
+        self.classes = list(self.by_key[1]["id"].values())
+    
+    def get(self, level: int, category_id: int) -> Optional[CategoryView]:
+        return self.by_key[level]["id"].get(category_id)
+    
+    def parent(self, category: CategoryView) -> Optional[CategoryView]:
+        if category.parent_id is None:
+            return None
+        return self.get(category.level - 1, category.parent_id)
+
+
+# Built on the first hierarchy read and rebuilt after CTC_CACHE_TTL or invalidation
+_ctc_tree: Optional[_CategoryTree] = None
+_ctc_tree_lock = asyncio.Lock()
+
+
+def invalidate_ctc_cache():
+    """Drop all cached CTC reads, e.g. after the CTC tables are written."""
+    global _ctc_tree
+    _ctc_tree = None
+    _category_id_by_uuid.clear()
+    for cache in _category_caches.values():
+        cache.clear()
+
+
+def _cache_category(category: CategoryView):
+    for key, cache in _category_caches.items():
+        cache[(category.level, getattr(category, key))] = category
+    _category_id_by_uuid[category.uuid] = (category.level, category.id)
+
+
 class CTCQueryHelper:
-    """Helper class for querying CTC categories."""
+    """Helper class for querying CTC categories.
+    
+    Classes, types and categories are returned alike as CategoryView nodes.
+    Ids and codes are only unique within a level, so id-keyed methods take the
+    ``level`` of the node they name (1 = class, 2 = type, 3 = category).
+    """
     
-    async def get_all_classes(self) -> List[CTCCategory]:
+    async def get_all_classes(self) -> List[CategoryView]:
         """Get all product classes (level 1)."""
-        async with get_async_session() as session:
-            result = await session.execute(
-                select(CTCCategory).where(CTCCategory.level == 1)
-            )
-            return result.scalars().all()
+        return list((await self._tree()).classes)
     
-    async def get_types_by_class(self, class_id: int) -> List[CTCCategory]:
+    async def get_types_by_class(self, class_id: int) -> List[CategoryView]:
         """Get all product types for a given class."""
-        async with get_async_session() as session:
-            result = await session.execute(
-                select(CTCCategory).where(
-                    CTCCategory.level == 2,
-                    CTCCategory.parent_id == class_id
-                )
-            )
-            return result.scalars().all()
+        return await self.get_children(class_id, level=1)
     
-    async def get_types_by_class_uuid(self, class_uuid: str) -> List[CTCCategory]:
+    async def get_types_by_class_uuid(self, class_uuid: str) -> List[CategoryView]:
         """Get all product types for a given class using UUID."""
-        async with get_async_session() as session:
-            result = await session.execute(
-                select(CTCCategory).where(
-                    CTCCategory.level == 2,
-                    CTCCategory.parent_uuid == class_uuid
-                )
-            )
-            return result.scalars().all()
+        located = await self._locate_uuid(class_uuid)
+        if located is None or located[0] != 1:
+            return []
+        return await self.get_children(located[1], level=1)
     
-    async def get_categories_by_type(self, type_id: int) -> List[CTCCategory]:
+    async def get_categories_by_type(self, type_id: int) -> List[CategoryView]:
         """Get all product categories for a given type."""
-        async with get_async_session() as session:
-            result = await session.execute(
-                select(CTCCategory).where(
-                    CTCCategory.level == 3,
-                    CTCCategory.parent_id == type_id
-                )
-            )
-            return result.scalars().all()
+        return await self.get_children(type_id, level=2)
     
-    async def get_categories_by_type_uuid(self, type_uuid: str) -> List[CTCCategory]:
+    async def get_categories_by_type_uuid(self, type_uuid: str) -> List[CategoryView]:
         """Get all product categories for a given type using UUID."""
-        async with get_async_session() as session:
-            result = await session.execute(
-                select(CTCCategory).where(
-                    CTCCategory.level == 3,
-                    CTCCategory.parent_uuid == type_uuid
-                )
-            )
-            return result.scalars().all()
+        located = await self._locate_uuid(type_uuid)
+        if located is None or located[0] != 2:
+            return []
+        return await self.get_children(located[1], level=2)
     
-    async def get_full_hierarchy(self, class_id: Optional[int] = None) -> List[CTCCategory]:
-        """Get the full hierarchy for a class or all classes."""
-        async with get_async_session() as session:
-            if class_id:
-                # Get specific class with its full hierarchy
-                result = await session.execute(
-                    select(CTCCategory)
-                    .where(CTCCategory.id == class_id, CTCCategory.level == 1)
-                    .options(
-                        joinedload(CTCCategory.children).joinedload(CTCCategory.children)
-                    )
-                )
-                return result.scalar_one_or_none()
-            else:
-                # Get all classes with their hierarchies
-                result = await session.execute(
-                    select(CTCCategory)
-                    .where(CTCCategory.level == 1)
-                    .options(
-                        joinedload(CTCCategory.children).joinedload(CTCCategory.children)
-                    )
-                )
-                return result.scalars().all()
+    async def get_full_hierarchy(self, class_id: Optional[int] = None) -> List[CategoryView]:
+        """Get the full hierarchy for a class or all classes.
+        
+        Classes come back with their types and categories nested in ``children``.
+        """
+        tree = await self._tree()
+        if class_id:
+            return tree.get(1, class_id)
+        return list(tree.classes)
     
-    async def get_full_hierarchy_by_uuid(self, class_uuid: str) -> Optional[CTCCategory]:
+    async def get_full_hierarchy_by_uuid(self, class_uuid: str) -> Optional[CategoryView]:
         """Get the full hierarchy for a class using UUID."""
-        async with get_async_session() as session:
-            result = await session.execute(
-                select(CTCCategory)
-                .where(CTCCategory.uuid == class_uuid, CTCCategory.level == 1)
-                .options(
-                    joinedload(CTCCategory.children).joinedload(CTCCategory.children)
-                )
-            )
-            return result.scalar_one_or_none()
+        category = (await self._tree()).by_uuid.get(class_uuid)
+        return category if category is not None and category.level == 1 else None
     
-    async def get_category_path(self, category_id: int) -> Optional[List[CTCCategory]]:
+    async def get_category_path(self, category_id: int, *, level: int = 3) -> Optional[List[CategoryView]]:
         """Get the full path from root to a specific category."""
-        async with get_async_session() as session:
-            # Get the category
-            result = await session.execute(
-                select(CTCCategory).where(CTCCategory.id == category_id)
-            )
-            category = result.scalar_one_or_none()
-            
-            if not category:
-                return None
-            
-            path = [category]
-            current = category
-            
-            # Walk up the hierarchy
-            while current.parent_id:
-                result = await session.execute(
-                    select(CTCCategory).where(CTCCategory.id == current.parent_id)
-                )
-                current = result.scalar_one_or_none()
-                if current:
-                    path.insert(0, current)
-                else:
-                    break
-            
-            return path
+        return await self._read_categories(_category_path_stmt(level), category_id) or None
     
-    async def get_category_path_by_uuid(self, category_uuid: str) -> Optional[List[CTCCategory]]:
+    async def get_category_path_by_uuid(self, category_uuid: str) -> Optional[List[CategoryView]]:
         """Get the full path from root to a specific category using UUID."""
-        async with get_async_session() as session:
-            # Get the category
-            result = await session.execute(
-                select(CTCCategory).where(CTCCategory.uuid == category_uuid)
-            )
-            category = result.scalar_one_or_none()
-            
-            if not category:
-                return None
-            
-            path = [category]
-            current = category
-            
-            # Walk up the hierarchy using UUIDs
-            while current.parent_uuid:
-                result = await session.execute(
-                    select(CTCCategory).where(CTCCategory.uuid == current.parent_uuid)
-                )
-                current = result.scalar_one_or_none()
-                if current:
-                    path.insert(0, current)
-                else:
-                    break
-            
-            return path
+        located = await self._locate_uuid(category_uuid)
+        if located is None:
+            return None
+        level, category_id = located
+        return await self.get_category_path(category_id, level=level)
+    
+    async def get_ancestors(self, category_id: int, *, level: int = 3) -> List[CategoryView]:
+        """Get all ancestors of a category, root first."""
+        if level == 1:
+            return []
+        return await self._read_categories(_category_path_stmt(level, include_self=False), category_id)
+    
+    async def get_descendants(self, category_id: int, *, level: int = 1) -> List[CategoryView]:
+        """Get all descendants of a node, level by level. Defaults to a class's subtree."""
+        if level + 1 not in CTC_LEVEL_MODELS:
+            return []
+        return await self._read_categories(_category_subtree_stmt(level), category_id)
     
-    async def search_categories(self, search_term: str, level: Optional[int] = None) -> List[CTCCategory]:
+    async def search_categories(self, search_term: str, level: Optional[int] = None) -> List[CategoryView]:
         """Search categories by name or code."""
-        async with get_async_session() as session:
-            query = select(CTCCategory).where(
-                (CTCCategory.name.ilike(f'%{search_term}%')) |
-                (CTCCategory.code.ilike(f'%{search_term}%'))
+        if level and level not in CTC_LEVEL_MODELS:
+            return []
+        levels = [level] if level else list(CTC_LEVEL_MODELS)
+        pattern = f'%{search_term}%'
+        stmt = union_all(*(
+            _category_view_select(each).where(
+                (CTC_LEVEL_MODELS[each].name.ilike(pattern)) |
+                (CTC_LEVEL_MODELS[each].code.ilike(pattern))
             )
-            
-            if level:
-                query = query.where(CTCCategory.level == level)
-            
-            result = await session.execute(query)
-            return result.scalars().all()
+            for each in levels
+        )).order_by("level", "id")
+        async with get_read_connection() as conn:
+            return [CategoryView(*row) for row in await conn.execute(stmt)]
     
     async def get_products_by_category(self, category_id: int) -> List[ProductModel]:
         """Get all products associated with a specific category."""
-        async with get_async_session() as session:
+        async with get_async_readonly_session() as session:
             result = await session.execute(
                 select(ProductModel)
                 .join(CTCCategory, ProductModel.id == CTCCategory.product_id)
@@ -633,7 +1051,7 @@ class CTCQueryHelper:
     
     async def get_products_by_category_uuid(self, category_uuid: str) -> List[ProductModel]:
         """Get all products associated with a specific category using UUID."""
-        async with get_async_session() as session:
+        async with get_async_readonly_session() as session:
             result = await session.execute(
                 select(ProductModel)
                 .join(CTCCategory, ProductModel.id == CTCCategory.product_id)
@@ -643,7 +1061,7 @@ class CTCQueryHelper:
     
     async def get_categories_by_product(self, product_id: int) -> List[CTCCategory]:
         """Get all categories associated with a specific product."""
-        async with get_async_session() as session:
+        async with get_async_readonly_session() as session:
             result = await session.execute(
                 select(CTCCategory).where(CTCCategory.product_id == product_id)
             )
@@ -651,156 +1069,277 @@ class CTCQueryHelper:
     
     async def get_statistics(self) -> dict:
         """Get statistics about the CTC categories."""
-        async with get_async_session() as session:
-            stats = {}
-            
-            # Count by level
-            for level in [1, 2, 3]:
-                result = await session.execute(
-                    select(CTCCategory).where(CTCCategory.level == level)
-                )
-                count = len(result.scalars().all())
-                stats[f'level_{level}_count'] = count
-            
-            # Count active vs inactive
-            result = await session.execute(
-                select(CTCCategory).where(CTCCategory.active == True)
-            )
-            active_count = len(result.scalars().all())
-            
-            result = await session.execute(
-                select(CTCCategory).where(CTCCategory.active == False)
-            )
-            inactive_count = len(result.scalars().all())
-            
-            stats['active_count'] = active_count
-            stats['inactive_count'] = inactive_count
-            
-            # Count categories with products
+        async with get_async_readonly_session() as session:
+            # Classes, types and categories live in their own tables; stack
+            # them so every statistic comes back from a single aggregate query.
+            # count() skips the NULLs from unmatched CASE branches.
+            nodes = union_all(
+                select(literal_column("1").label('level'), CTCClass.active, cast(null(), Integer).label('product_id')),
+                select(literal_column("2"), CTCType.active, cast(null(), Integer)),
+                select(literal_column("3"), CTCCategory.active, CTCCategory.product_id),
+            ).subquery()
             result = await session.execute(
-                select(CTCCategory).where(CTCCategory.product_id.isnot(None))
+                select(
+                    func.count(case((nodes.c.level == 1, 1))).label('level_1_count'),
+                    func.count(case((nodes.c.level == 2, 1))).label('level_2_count'),
+                    func.count(case((nodes.c.level == 3, 1))).label('level_3_count'),
+                    func.count(case((nodes.c.active == True, 1))).label('active_count'),
+                    func.count(case((nodes.c.active == False, 1))).label('inactive_count'),
+                    func.count(nodes.c.product_id).label('categories_with_products'),
+                )
             )
-            categories_with_products = len(result.scalars().all())
-            stats['categories_with_products'] = categories_with_products
-            
-            return stats
+            return dict(result.one()._mapping)
     
-    async def get_category_by_code(self, code: str) -> Optional[CTCCategory]:
-        """Get a category by its code."""
-        async with get_async_session() as session:
-            result = await session.execute(
-                select(CTCCategory).where(CTCCategory.code == code)
-            )
-            return result.scalar_one_or_none()
+    async def _tree(self) -> _CategoryTree:
+        global _ctc_tree
+        tree = _ctc_tree
+        if tree is None or time.monotonic() - tree.loaded_at > CTC_CACHE_TTL:
+            async with _ctc_tree_lock:
+                # Another caller may have rebuilt it while we waited
+                if _ctc_tree is tree:
+                    # Plain column rows on a Core connection: the snapshot
+                    # outlives the request, so it must hold no session-bound rows
+                    async with get_read_connection() as conn:
+                        rows_by_level = {
+                            level: (await conn.execute(
+                                _category_view_select(level).order_by(model.id)
+                            )).all()
+                            for level, model in CTC_LEVEL_MODELS.items()
+                        }
+                    _ctc_tree = _CategoryTree(rows_by_level)
+                tree = _ctc_tree
+        return tree
     
-    async def get_category_by_id(self, category_id: int) -> Optional[CTCCategory]:
-        """Get a category by its ID."""
-        async with get_async_session() as session:
-            result = await session.execute(
-                select(CTCCategory).where(CTCCategory.id == category_id)
-            )
-            return result.scalar_one_or_none()
+    async def _read_categories(self, stmt, value) -> List[CategoryView]:
+        async with get_read_connection() as conn:
+            result = await conn.execute(stmt, {"value": value})
+            return [CategoryView(*row) for row in result]
     
-    async def get_category_by_uuid(self, category_uuid: str) -> Optional[CTCCategory]:
-        """Get a category by its UUID."""
-        async with get_async_session() as session:
+    async def _get_category_by(self, key: str, value, level: int) -> Optional[CategoryView]:
+        category = (await self._tree()).by_key[level][key].get(value)
+        if category is not None:
+            return category
+        # Not in the snapshot, e.g. written since it was taken
+        cached = _category_caches[key].get((level, value))
+        if cached is not None:
+            return cached
+        # Plain column rows, so skip the ORM session entirely
+        async with get_read_connection() as conn:
+            row = (await conn.execute(_category_view_stmt(level, key), {"value": value})).first()
+        if row is None:
+            return None
+        category = CategoryView(*row)
+        _cache_category(category)
+        return category
+    
+    async def _locate_uuid(self, category_uuid: str) -> Optional[Tuple[int, int]]:
+        """(level, id) of the node with this uuid, or None."""
+        category = (await self._tree()).by_uuid.get(category_uuid)
+        if category is not None:
+            return category.level, category.id
+        located = _category_id_by_uuid.get(category_uuid)
+        if located is not None:
+            return located
+        async with get_read_connection() as conn:
+            row = (await conn.execute(_category_locate_stmt(), {"value": category_uuid})).first()
+        if row is None:
+            return None
+        located = _category_id_by_uuid[category_uuid] = (int(row[0]), row[1])
+        return located
+    
+    async def _get_categories_by(self, key: str, values: Iterable, level: Optional[int]) -> Dict[object, CategoryView]:
+        # uuids are unique across the three tables, so uuid lookups span every level
+        values = list(dict.fromkeys(values))
+        tree = await self._tree()
+        index = tree.by_uuid if level is None else tree.by_key[level][key]
+        found = {value: index[value] for value in values if value in index}
+        missing = [value for value in values if value not in found]
+        if missing:
+            levels = list(CTC_LEVEL_MODELS) if level is None else [level]
+            stmt = union_all(*(
+                _category_view_select(level).where(getattr(CTC_LEVEL_MODELS[level], key).in_(missing))
+                for level in levels
+            ))
+            async with get_read_connection() as conn:
+                for row in await conn.execute(stmt):
+                    category = CategoryView(*row)
+                    found[getattr(category, key)] = category
+        return found
+    
+    async def get_category_by_code(self, code: str, *, level: int = 3) -> Optional[CategoryView]:
+        """Get a category by its code.
+        
+        Use get_categories_bulk_by_code rather than calling this in a loop.
+        """
+        return await self._get_category_by("code", code, level)
+    
+    async def get_category_by_id(self, category_id: int, *, level: int = 3) -> Optional[CategoryView]:
+        """Get a category by its ID.
+        
+        Use get_categories_bulk rather than calling this in a loop.
+        """
+        return await self._get_category_by("id", category_id, level)
+    
+    async def get_category_by_uuid(self, category_uuid: str) -> Optional[CategoryView]:
+        """Get a class, type or category by its UUID.
+        
+        Use get_categories_bulk_by_uuid rather than calling this in a loop.
+        """
+        located = await self._locate_uuid(category_uuid)
+        if located is None:
+            return None
+        level, category_id = located
+        return await self._get_category_by("id", category_id, level)
+    
+    async def get_category_summary_by_id(self, category_id: int):
+        """Get just the id, code and name of a category as a row, without loading the entity."""
+        async with get_async_readonly_session() as session:
             result = await session.execute(
-                select(CTCCategory).where(CTCCategory.uuid == category_uuid)
+                select(CTCCategory.id, CTCCategory.code, CTCCategory.name)
+                .where(CTCCategory.id == category_id)
             )
-            return result.scalar_one_or_none()
+            return result.one_or_none()
     
-    async def get_children(self, parent_id: int) -> List[CTCCategory]:
-        """Get all direct children of a category."""
-        async with get_async_session() as session:
-            result = await session.execute(
-                select(CTCCategory).where(CTCCategory.parent_id == parent_id)
+    async def get_categories_bulk(self, category_ids: Iterable[int], *, level: int = 3) -> Dict[int, CategoryView]:
+        """Get several categories by ID in one query, keyed by ID. Unknown IDs are absent."""
+        return await self._get_categories_by("id", category_ids, level)
+    
+    async def get_categories_bulk_by_code(self, codes: Iterable[str], *, level: int = 3) -> Dict[str, CategoryView]:
+        """Get several categories by code in one query, keyed by code. Unknown codes are absent."""
+        return await self._get_categories_by("code", codes, level)
+    
+    async def get_categories_bulk_by_uuid(self, category_uuids: Iterable[str]) -> Dict[str, CategoryView]:
+        """Get several classes, types or categories by UUID in one query, keyed by UUID. Unknown UUIDs are absent."""
+        return await self._get_categories_by("uuid", category_uuids, None)
+    
+    async def get_children(self, parent_id: int, *, level: int = 2) -> List[CategoryView]:
+        """Get all direct children of a node; ``level`` is the parent's, so a type by default.
+        
+        To walk a tree, load each level with get_children_bulk rather than
+        calling this once per node.
+        """
+        if level + 1 not in CTC_LEVEL_MODELS:
+            return []
+        parent = (await self._tree()).get(level, parent_id)
+        if parent is not None:
+            return list(parent.children)
+        return await self._read_categories(_category_children_stmt(level), parent_id)
+    
+    async def aiter_children(
+        self, parent_id: int, chunk: int = 500, *, level: int = 2
+    ) -> AsyncGenerator[CategoryView, None]:
+        """Stream the direct children of a node, fetching ``chunk`` rows at a time."""
+        if level + 1 not in CTC_LEVEL_MODELS:
+            return
+        async with get_read_connection() as conn:
+            result = await conn.stream(
+                _category_children_stmt(level).execution_options(yield_per=chunk),
+                {"value": parent_id},
             )
-            return result.scalars().all()
+            async for row in result:
+                yield CategoryView(*row)
     
-    async def get_children_by_uuid(self, parent_uuid: str) -> List[CTCCategory]:
+    async def get_children_by_uuid(self, parent_uuid: str) -> List[CategoryView]:
         """Get all direct children of a category using UUID."""
-        async with get_async_session() as session:
-            result = await session.execute(
-                select(CTCCategory).where(CTCCategory.parent_uuid == parent_uuid)
+        located = await self._locate_uuid(parent_uuid)
+        if located is None:
+            return []
+        level, parent_id = located
+        return await self.get_children(parent_id, level=level)
+    
+    async def get_node_with_children(
+        self, category_id: int, *, level: int = 2
+    ) -> Tuple[Optional[CategoryView], List[CategoryView]]:
+        """Get a node and its direct children, querying both concurrently."""
+        # Separate connections so the two SELECTs run side by side
+        async def fetch_node():
+            async with get_read_connection() as conn:
+                return (await conn.execute(_category_view_stmt(level, "id"), {"value": category_id})).first()
+        
+        async def fetch_children():
+            if level + 1 not in CTC_LEVEL_MODELS:
+                return []
+            return await self._read_categories(_category_children_stmt(level), category_id)
+        
+        category = _category_caches["id"].get((level, category_id))
+        if category is not None:
+            return category, await self.get_children(category_id, level=level)
+        row, children = await asyncio.gather(fetch_node(), fetch_children())
+        if row is None:
+            return None, []
+        category = CategoryView(*row)
+        _cache_category(category)
+        return category, children
+    
+    async def get_children_bulk(
+        self, parent_ids: List[int], *, level: int = 2
+    ) -> Dict[int, List[CategoryView]]:
+        """Get the direct children of several nodes in one query, keyed by parent ID.
+        
+        Parents without children are absent from the result.
+        """
+        child_level = level + 1
+        if not parent_ids or child_level not in CTC_LEVEL_MODELS:
+            return {}
+        async with get_read_connection() as conn:
+            result = await conn.execute(
+                _category_view_select(child_level)
+                .where(CTC_PARENT_KEYS[child_level].in_(parent_ids))
+                .order_by(CTC_LEVEL_MODELS[child_level].id)
             )
-            return result.scalars().all()
+            children = defaultdict(list)
+            for row in result:
+                category = CategoryView(*row)
+                children[category.parent_id].append(category)
+            return dict(children)
     
-    async def get_parent(self, category_id: int) -> Optional[CTCCategory]:
+    async def get_parent(self, category_id: int, *, level: int = 3) -> Optional[CategoryView]:
         """Get the parent of a category."""
-        async with get_async_session() as session:
-            # First get the category to find its parent_id
-            result = await session.execute(
-                select(CTCCategory).where(CTCCategory.id == category_id)
-            )
-            category = result.scalar_one_or_none()
-            
-            if not category or not category.parent_id:
-                return None
-            
-            # Get the parent
-            result = await session.execute(
-                select(CTCCategory).where(CTCCategory.id == category.parent_id)
-            )
-            return result.scalar_one_or_none()
+        if level == 1:
+            return None
+        tree = await self._tree()
+        category = tree.get(level, category_id)
+        if category is not None:
+            return tree.parent(category)
+        rows = await self._read_categories(_ancestor_select(level - 1, level), category_id)
+        return rows[0] if rows else None
     
-    async def get_parent_by_uuid(self, category_uuid: str) -> Optional[CTCCategory]:
+    async def get_parent_by_uuid(self, category_uuid: str) -> Optional[CategoryView]:
         """Get the parent of a category using UUID."""
-        async with get_async_session() as session:
-            # First get the category to find its parent_uuid
-            result = await session.execute(
-                select(CTCCategory).where(CTCCategory.uuid == category_uuid)
-            )
-            category = result.scalar_one_or_none()
-            
-            if not category or not category.parent_uuid:
-                return None
-            
-            # Get the parent
-            result = await session.execute(
-                select(CTCCategory).where(CTCCategory.uuid == category.parent_uuid)
-            )
-            return result.scalar_one_or_none()
+        located = await self._locate_uuid(category_uuid)
+        if located is None:
+            return None
+        level, category_id = located
+        return await self.get_parent(category_id, level=level)
     
-    async def get_siblings(self, category_id: int) -> List[CTCCategory]:
+    async def get_siblings(self, category_id: int, *, level: int = 3) -> List[CategoryView]:
         """Get all siblings of a category (same parent)."""
-        async with get_async_session() as session:
-            # First get the category to find its parent_id
-            result = await session.execute(
-                select(CTCCategory).where(CTCCategory.id == category_id)
-            )
-            category = result.scalar_one_or_none()
-            
-            if not category or not category.parent_id:
+        if level == 1:
+            return []
+        tree = await self._tree()
+        category = tree.get(level, category_id)
+        if category is not None:
+            parent = tree.parent(category)
+            if parent is None:
                 return []
-            
-            # Get all siblings
-            result = await session.execute(
-                select(CTCCategory).where(
-                    CTCCategory.parent_id == category.parent_id,
-                    CTCCategory.id != category_id
-                )
-            )
-            return result.scalars().all()
+            return [sibling for sibling in parent.children if sibling.id != category_id]
+        model = CTC_LEVEL_MODELS[level]
+        parent_key = CTC_PARENT_KEYS[level]
+        category = aliased(model)
+        return await self._read_categories(
+            _category_view_select(level)
+            .join(category, getattr(category, parent_key.key) == parent_key)
+            .where(category.id == bindparam("value"), model.id != category.id)
+            .order_by(model.id),
+            category_id,
+        )
     
-    async def get_siblings_by_uuid(self, category_uuid: str) -> List[CTCCategory]:
+    async def get_siblings_by_uuid(self, category_uuid: str) -> List[CategoryView]:
         """Get all siblings of a category using UUID."""
-        async with get_async_session() as session:
-            # First get the category to find its parent_uuid
-            result = await session.execute(
-                select(CTCCategory).where(CTCCategory.uuid == category_uuid)
-            )
-            category = result.scalar_one_or_none()
-            
-            if not category or not category.parent_uuid:
-                return []
-            
-            # Get all siblings
-            result = await session.execute(
-                select(CTCCategory).where(
-                    CTCCategory.parent_uuid == category.parent_uuid,
-                    CTCCategory.uuid != category_uuid
-                )
-            )
-            return result.scalars().all()
+        located = await self._locate_uuid(category_uuid)
+        if located is None:
+            return []
+        level, category_id = located
+        return await self.get_siblings(category_id, level=level)
 
 storage = SQLStorage()
@@ -1,24 +1,40 @@
 import os
-import tempfile
+import sqlite3
 import asyncio
 import pytest
-from httpx import AsyncClient
+import pytest_asyncio
+from httpx import AsyncClient, ASGITransport, Limits
 
-# setup temporary database before importing app
-_db_fd, _db_path = tempfile.mkstemp(prefix="test_db", suffix=".db")
-os.close(_db_fd)
-os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{_db_path}"
+# setup an in-memory database shared by every connection before importing app
+_DB_URI = "file:testdb?mode=memory&cache=shared"
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{_DB_URI}&uri=true"
+# A shared-cache memory database lives only while a connection is open
+_db_keepalive = sqlite3.connect(_DB_URI, uri=True)
 
 from src.main import app
 from src.database import init_db
 
-@pytest.fixture(scope="session", autouse=True)
+@pytest.hookimpl(optionalhook=True)
+def pytest_asyncio_loop_factories(config, item):
+    # All tests share one session loop (pytest.ini); run it on uvloop when installed
+    try:
+        import uvloop
+    except ImportError:
+        return {"asyncio": asyncio.new_event_loop}
+    return {"uvloop": uvloop.new_event_loop}
+
+@pytest_asyncio.fixture(scope="session", loop_scope="session", autouse=True)
 async def setup_database():
-    await init_db()
+    # Nothing to drop in a fresh memory database (and DROP SCHEMA is PostgreSQL-only)
+    await init_db(drop_existing=False)
     yield
-    os.remove(_db_path)
+    _db_keepalive.close()
 
-@pytest.fixture
+@pytest_asyncio.fixture(scope="session", loop_scope="session")
 async def client():
-    async with AsyncClient(app=app, base_url="http://testserver") as ac:
+    # One client (and connection pool) for the whole run; it must live on the
+    # same event loop as the tests, see asyncio_default_test_loop_scope
+    transport = ASGITransport(app=app)
+    limits = Limits(max_keepalive_connections=20, max_connections=20)
+    async with AsyncClient(transport=transport, base_url="http://localhost", limits=limits) as ac:
         yield ac
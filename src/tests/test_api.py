@@ -1,8 +1,8 @@
-import pytest
 from decimal import Decimal
-from datetime import date
+from sqlalchemy import select
+from src.database import get_async_session
+from src.db_models import ProductModel
 
-@pytest.mark.asyncio
 async def test_product_crud(client):
     product = {
         "distributor_name": "dist",
@@ -28,13 +28,14 @@ async def test_product_crud(client):
     resp = await client.post("/products", json=product)
     assert resp.status_code == 201
     created = resp.json()
-    pid = created["id"]
+    assert created["product_code"] == "P1"
+    assert created["uuid"]
 
     resp = await client.get("/products")
     assert resp.status_code == 200
-    assert any(p["id"] == pid for p in resp.json())
+    assert any(p["uuid"] == created["uuid"] for p in resp.json())
 
-    resp = await client.get(f"/products/{pid}")
+    resp = await client.get("/products/P1")
     assert resp.status_code == 200
     assert resp.json()["product_name"] == "Prod1"
 
@@ -42,6 +43,10 @@ async def test_product_crud(client):
     assert resp.status_code == 200
     assert len(resp.json()) >= 1
 
+    # Product responses carry no id, but update and delete are keyed on it
+    async with get_async_session() as session:
+        pid = await session.scalar(select(ProductModel.id).where(ProductModel.product_code == "P1"))
+
     resp = await client.put(f"/products/{pid}", json={"product_name": "New"})
     assert resp.status_code == 200
     assert resp.json()["product_name"] == "New"
@@ -49,16 +54,14 @@ async def test_product_crud(client):
     resp = await client.delete(f"/products/{pid}")
     assert resp.status_code == 204
 
-    resp = await client.get(f"/products/{pid}")
+    resp = await client.get("/products/P1")
     assert resp.status_code == 404
 
-@pytest.mark.asyncio
 async def test_search_short_query(client):
     resp = await client.get("/products/search", params={"q": "x"})
     assert resp.status_code == 200
     assert resp.json() == []
 
-@pytest.mark.asyncio
 async def test_bulk_and_related(client):
     base = {
         "distributor_name": "d",
@@ -79,7 +82,7 @@ async def test_bulk_and_related(client):
             }
         ]
     }
-    # bulk create two products, second has duplicate code
+    # bulk create two products, second has duplicate code and is skipped
     data = [
         {**base, "product_code": "B1", "product_name": "Bulk1"},
         {**base, "product_code": "B1", "product_name": "BulkDup"},
@@ -88,50 +91,24 @@ async def test_bulk_and_related(client):
     assert resp.status_code == 200
     body = resp.json()
     assert body["success"] == 1
-    assert body["errors"] == 1
-
-    pid = body["created"][0]["id"]
-
-    # sell-in and sell-through
-    sell_in = {
-        "product_id": pid,
-        "quantity": 10,
-        "unit_cost": 1.0,
-        "total_cost": 10.0,
-        "transaction_date": str(date.today()),
-        "month_partition": date.today().strftime("%Y-%m"),
-    }
-    resp = await client.post("/api/sell-ins", json=sell_in)
-    assert resp.status_code == 201
-
-    sell_through = {
-        "product_id": pid,
-        "quantity": 4,
-        "unit_price": 2.0,
-        "total_revenue": 8.0,
-        "transaction_date": str(date.today()),
-        "month_partition": date.today().strftime("%Y-%m"),
-    }
-    resp = await client.post("/api/sell-throughs", json=sell_through)
-    assert resp.status_code == 201
-
-    resp = await client.get("/api/sell-ins", params={"product_id": pid})
-    assert resp.status_code == 200
-    assert len(resp.json()) == 1
+    assert body["errors"] == 0
+    assert body["created"][0]["product_name"] == "Bulk1"
 
-    resp = await client.get("/api/sell-throughs", params={"product_id": pid})
+    # codes that already exist are skipped on later uploads too
+    resp = await client.post("/products/bulk", json=data)
     assert resp.status_code == 200
-    assert len(resp.json()) == 1
+    body = resp.json()
+    assert body["success"] == 0
+    assert body["errors"] == 0
 
-    month = date.today().strftime("%Y-%m")
-    resp = await client.get("/analytics/products", params={"product_id": pid, "month": month})
+    resp = await client.get("/analytics/products")
     assert resp.status_code == 200
-    data = resp.json()[0]
-    assert data["sell_in_quantity"] == 10
-    assert data["sell_through_quantity"] == 4
+    analytics = {p["product_code"]: p for p in resp.json()}
+    assert analytics["B1"]["product_name"] == "Bulk1"
+    assert Decimal(analytics["B1"]["total_revenue"]) == Decimal("5.0")
 
-    resp = await client.get("/analytics/overall", params={"month": month})
+    resp = await client.get("/analytics/overall")
     assert resp.status_code == 200
     overall = resp.json()
-    assert overall["total_sell_in"] >= 10
-    assert overall["total_sell_through"] >= 4
+    assert overall["total_products"] >= 1
+    assert Decimal(overall["total_revenue"]) >= Decimal("5.0")
@@ -0,0 +1,212 @@
+from datetime import datetime
+import pytest_asyncio
+from src.ctc_init import CTCInitializer
+from src.database import get_async_session
+from src.db_models import CTCCategory, CTCClass, CTCType, ProductModel
+from src.storage import CTCQueryHelper, invalidate_ctc_cache
+
+
+def ctc_row(model, id, code, active=True, **columns):
+    now = datetime(2024, 1, 1)
+    return model(
+        id=id,
+        uuid=f"{model.__tablename__}-{id}",
+        code=code,
+        name=f"{code} name",
+        store="s",
+        active=active,
+        modified_by="t",
+        modified=now,
+        created_by="t",
+        created=now,
+        **columns,
+    )
+
+
+def codes(nodes):
+    return [node.code for node in nodes]
+
+
+@pytest_asyncio.fixture(scope="module")
+async def helper():
+    # Ids repeat across the three tables on purpose: they are only unique per level
+    async with get_async_session() as session:
+        product = ProductModel(
+            distributor_name="d", brand_name="b", product_code="CTC-P1",
+            product_name="CTC product", category_name="c",
+        )
+        session.add(product)
+        await session.flush()
+        session.add_all([
+            ctc_row(CTCClass, 501, "TCL1"),
+            ctc_row(CTCClass, 502, "TCL2", active=False),
+            ctc_row(CTCType, 501, "TTY1", class_id=501),
+            ctc_row(CTCType, 510, "TTY10", class_id=501),
+            ctc_row(CTCType, 512, "TTY12", class_id=502),
+            ctc_row(CTCCategory, 501, "TCA1", type_id=501),
+            ctc_row(CTCCategory, 600, "TCA600", type_id=501, product_id=product.id),
+            ctc_row(CTCCategory, 601, "TCA601", type_id=510),
+            ctc_row(CTCCategory, 602, "TCA602", type_id=501, active=False),
+        ])
+        await session.commit()
+    invalidate_ctc_cache()
+    return CTCQueryHelper()
+
+
+async def test_hierarchy_reads(helper):
+    classes = {node.code: node for node in await helper.get_all_classes()}
+    assert {"TCL1", "TCL2"} <= set(classes)
+    assert classes["TCL2"].active is False
+
+    assert codes(await helper.get_types_by_class(501)) == ["TTY1", "TTY10"]
+    assert codes(await helper.get_types_by_class_uuid("ctc_classes-502")) == ["TTY12"]
+    # A type's uuid does not name a class
+    assert await helper.get_types_by_class_uuid("ctc_types-501") == []
+    assert codes(await helper.get_categories_by_type(501)) == ["TCA1", "TCA600", "TCA602"]
+    assert codes(await helper.get_categories_by_type_uuid("ctc_types-510")) == ["TCA601"]
+
+    root = await helper.get_full_hierarchy(501)
+    assert codes(root.children) == ["TTY1", "TTY10"]
+    assert [codes(node.children) for node in root.children] == [["TCA1", "TCA600", "TCA602"], ["TCA601"]]
+    assert (await helper.get_full_hierarchy_by_uuid("ctc_classes-502")).code == "TCL2"
+    assert await helper.get_full_hierarchy_by_uuid("ctc_types-512") is None
+
+    assert codes(await helper.search_categories("TCA60")) == ["TCA600", "TCA601", "TCA602"]
+    assert codes(await helper.search_categories("TTY1", level=2)) == ["TTY1", "TTY10", "TTY12"]
+
+
+async def test_ancestors_and_descendants(helper):
+    assert codes(await helper.get_category_path(600)) == ["TCL1", "TTY1", "TCA600"]
+    assert codes(await helper.get_category_path(510, level=2)) == ["TCL1", "TTY10"]
+    assert codes(await helper.get_category_path_by_uuid("ctc_categories-601")) == ["TCL1", "TTY10", "TCA601"]
+    assert await helper.get_category_path(999) is None
+
+    assert codes(await helper.get_ancestors(601)) == ["TCL1", "TTY10"]
+    assert codes(await helper.get_ancestors(512, level=2)) == ["TCL2"]
+    assert await helper.get_ancestors(501, level=1) == []
+
+    assert codes(await helper.get_descendants(501)) == [
+        "TTY1", "TTY10", "TCA1", "TCA600", "TCA601", "TCA602",
+    ]
+    assert codes(await helper.get_descendants(501, level=2)) == ["TCA1", "TCA600", "TCA602"]
+    assert await helper.get_descendants(501, level=3) == []
+
+
+async def test_children(helper):
+    assert codes(await helper.get_children(501)) == ["TCA1", "TCA600", "TCA602"]
+    assert codes(await helper.get_children(501, level=1)) == ["TTY1", "TTY10"]
+    assert await helper.get_children(501, level=3) == []
+    assert codes([node async for node in helper.aiter_children(501, chunk=1)]) == ["TCA1", "TCA600", "TCA602"]
+    assert codes(await helper.get_children_by_uuid("ctc_classes-501")) == ["TTY1", "TTY10"]
+
+    node, children = await helper.get_node_with_children(502, level=1)
+    assert node.code == "TCL2"
+    assert codes(children) == ["TTY12"]
+    assert await helper.get_node_with_children(999) == (None, [])
+
+    bulk = await helper.get_children_bulk([501, 510, 512])
+    assert {parent: codes(nodes) for parent, nodes in bulk.items()} == {
+        501: ["TCA1", "TCA600", "TCA602"],
+        510: ["TCA601"],
+    }
+    bulk = await helper.get_children_bulk([501, 502], level=1)
+    assert {parent: codes(nodes) for parent, nodes in bulk.items()} == {501: ["TTY1", "TTY10"], 502: ["TTY12"]}
+
+    assert (await helper.get_parent(600)).code == "TTY1"
+    assert (await helper.get_parent(510, level=2)).code == "TCL1"
+    assert await helper.get_parent(501, level=1) is None
+    assert (await helper.get_parent_by_uuid("ctc_types-512")).code == "TCL2"
+    assert codes(await helper.get_siblings(600)) == ["TCA1", "TCA602"]
+    assert codes(await helper.get_siblings(501, level=2)) == ["TTY10"]
+    assert codes(await helper.get_siblings_by_uuid("ctc_categories-601")) == []
+
+
+async def test_bulk_lookups(helper):
+    category = await helper.get_category_by_id(600)
+    assert (category.code, category.level, category.parent_id, category.parent_uuid) == (
+        "TCA600", 3, 501, "ctc_types-501",
+    )
+    assert category.product_id is not None
+    assert (await helper.get_category_by_id(501, level=1)).code == "TCL1"
+    assert (await helper.get_category_by_id(501, level=2)).code == "TTY1"
+    assert (await helper.get_category_by_code("TTY12", level=2)).parent_uuid == "ctc_classes-502"
+    assert (await helper.get_category_by_uuid("ctc_types-510")).code == "TTY10"
+    assert await helper.get_category_by_id(999) is None
+    assert await helper.get_category_by_uuid("missing") is None
+
+    found = await helper.get_categories_bulk([501, 600, 999])
+    assert {key: node.code for key, node in found.items()} == {501: "TCA1", 600: "TCA600"}
+    found = await helper.get_categories_bulk_by_code(["TTY1", "TCA1"], level=2)
+    assert {key: node.code for key, node in found.items()} == {"TTY1": "TTY1"}
+    found = await helper.get_categories_bulk_by_uuid(["ctc_classes-501", "ctc_categories-601", "missing"])
+    assert {key: node.level for key, node in found.items()} == {"ctc_classes-501": 1, "ctc_categories-601": 3}
+
+    summary = await helper.get_category_summary_by_id(600)
+    assert (summary.id, summary.code, summary.name) == (600, "TCA600", "TCA600 name")
+
+
+async def test_reads_after_the_snapshot(helper):
+    await helper.get_all_classes()
+    # Rows written without invalidating are still found through SQL
+    async with get_async_session() as session:
+        session.add_all([
+            ctc_row(CTCType, 520, "TTY20", class_id=502),
+            ctc_row(CTCCategory, 700, "TCA700", type_id=520),
+            ctc_row(CTCCategory, 701, "TCA701", type_id=520),
+        ])
+        await session.commit()
+
+    assert codes(await helper.get_children(520)) == ["TCA700", "TCA701"]
+    assert (await helper.get_category_by_id(700)).parent_uuid == "ctc_types-520"
+    assert (await helper.get_category_by_uuid("ctc_categories-701")).code == "TCA701"
+    assert (await helper.get_parent(700)).code == "TTY20"
+    assert codes(await helper.get_siblings(700)) == ["TCA701"]
+    assert codes(await helper.get_siblings(520, level=2)) == ["TTY12"]
+    assert codes(await helper.get_category_path(701)) == ["TCL2", "TTY20", "TCA701"]
+
+
+async def test_statistics(helper):
+    product_id = (await helper.get_category_by_id(600)).product_id
+    before = await helper.get_statistics()
+    async with get_async_session() as session:
+        session.add_all([
+            ctc_row(CTCClass, 503, "TCL3"),
+            ctc_row(CTCType, 513, "TTY13", active=False, class_id=503),
+            ctc_row(CTCCategory, 603, "TCA603", type_id=513, product_id=product_id),
+            ctc_row(CTCCategory, 604, "TCA604", type_id=513),
+        ])
+        await session.commit()
+    after = await helper.get_statistics()
+
+    assert {key: after[key] - before[key] for key in after} == {
+        "level_1_count": 1,
+        "level_2_count": 1,
+        "level_3_count": 2,
+        "active_count": 3,
+        "inactive_count": 1,
+        "categories_with_products": 1,
+    }
+
+
+async def test_ctc_import_invalidates_cache(helper):
+    # Load the snapshot, then import rows it has not seen
+    assert "TCL9" not in codes(await helper.get_all_classes())
+    audit = {
+        "active": True, "modified_by": "t", "modified": "2024-01-01T00:00:00+00:00",
+        "created_by": "t", "created": "2024-01-01T00:00:00+00:00",
+        "deleted_by": None, "deleted": None, "store": "s",
+    }
+    data = [{
+        **audit, "id": 509, "code": "TCL9", "name": "Imported class",
+        "all_product_types": [{
+            **audit, "id": 519, "code": "TTY19", "name": "Imported type",
+            "all_product_categories": [{**audit, "id": 609, "code": "TCA609", "name": "Imported category"}],
+        }],
+    }]
+    assert await CTCInitializer().import_data(data)
+
+    # Served from a rebuilt snapshot, well inside CTC_CACHE_TTL
+    assert "TCL9" in codes(await helper.get_all_classes())
+    root = await helper.get_full_hierarchy(509)
+    assert codes(root.children) == ["TTY19"]
+    assert codes(root.children[0].children) == ["TCA609"]
@@ -0,0 +1,182 @@
+from datetime import datetime
+from sqlalchemy import func, select
+from src.database import get_async_session
+from src.db_models import CTCCategory, CTCClass, CTCType, ProductModel, RebateAgreementProduct
+
+
+def agreement_payload(**overrides):
+    payload = {
+        "agreement_type": "vendor",
+        "distributor_id": 1,
+        "description": "Rebate",
+        "start_date": "2024-01-01",
+        "end_date": "2024-12-31",
+        "calc_frequency": "monthly",
+        "basis": "quantity",
+        "rate_type": "percentage",
+        "products": [],
+        "product_category_ids": [],
+        "tiers": [],
+    }
+    payload.update(overrides)
+    return payload
+
+
+def tier(from_quantity, to_quantity, rebate_value):
+    return {
+        "from_quantity": from_quantity,
+        "to_quantity": to_quantity,
+        "rebate_value": rebate_value,
+        "rebate_unit": "percentage",
+    }
+
+
+def tier_keys(tiers):
+    return {(t["from_quantity"], t["to_quantity"], t["rebate_value"]) for t in tiers}
+
+
+async def seed_products(*codes):
+    async with get_async_session() as session:
+        products = [
+            ProductModel(
+                distributor_name="d",
+                brand_name="b",
+                product_code=code,
+                product_name=f"{code} name",
+                category_name="c",
+            )
+            for code in codes
+        ]
+        session.add_all(products)
+        await session.commit()
+        return [product.id for product in products]
+
+
+async def seed_categories(type_id, *category_ids):
+    now = datetime(2024, 1, 1)
+    audit = {"modified_by": "t", "modified": now, "created_by": "t", "created": now, "store": "s"}
+    async with get_async_session() as session:
+        session.add(CTCClass(id=type_id, code=f"RCL{type_id}", name="class", **audit))
+        session.add(CTCType(id=type_id, code=f"RTY{type_id}", name="type", class_id=type_id, **audit))
+        session.add_all(
+            CTCCategory(id=category_id, code=f"RCA{category_id}", name="category", type_id=type_id, **audit)
+            for category_id in category_ids
+        )
+        await session.commit()
+    return list(category_ids)
+
+
+async def link_count(agreement_id):
+    async with get_async_session() as session:
+        return await session.scalar(
+            select(func.count()).where(RebateAgreementProduct.rebate_agreement_id == agreement_id)
+        )
+
+
+async def test_update_rebate_agreement_syncs_links_and_tiers(client):
+    p1, p2, p3 = await seed_products("RB-SYNC-1", "RB-SYNC-2", "RB-SYNC-3")
+    c1, c2 = await seed_categories(9100, 9101, 9102)
+
+    resp = await client.post("/rebates/agreements", json=agreement_payload(
+        distributor_id=101,
+        products=[p1, p2],
+        product_category_ids=[c1],
+        tiers=[tier(0, 10, 1.0), tier(10, 20, 2.0)],
+    ))
+    assert resp.status_code == 201
+    created = resp.json()
+    kept_tier_id = next(t["id"] for t in created["tiers"] if t["from_quantity"] == 10)
+
+    # p1 and c1 are dropped, p3 and c2 added, p2 and the 10-20 tier kept
+    resp = await client.put(f"/rebates/agreements/{created['id']}", json=agreement_payload(
+        distributor_id=102,
+        products=[p2, p3],
+        product_category_ids=[c2],
+        tiers=[tier(10, 20, 2.0), tier(20, None, 3.0)],
+    ))
+    assert resp.status_code == 200
+    updated = resp.json()
+    assert updated["distributor_id"] == 102
+    assert sorted(updated["products"]) == [p2, p3]
+    assert updated["product_category_ids"] == [c2]
+    assert tier_keys(updated["tiers"]) == {(10, 20, 2.0), (20, None, 3.0)}
+    assert kept_tier_id in {t["id"] for t in updated["tiers"]}
+
+    resp = await client.get(f"/rebates/agreements/{created['id']}")
+    assert resp.status_code == 200
+    stored = resp.json()
+    assert stored["distributor_id"] == 102
+    assert sorted(stored["products"]) == [p2, p3]
+    assert stored["product_category_ids"] == [c2]
+    assert tier_keys(stored["tiers"]) == {(10, 20, 2.0), (20, None, 3.0)}
+    assert await link_count(created["id"]) == 3
+
+
+async def test_update_rebate_agreement_deduplicates_ids(client):
+    p1, p2 = await seed_products("RB-DUP-1", "RB-DUP-2")
+    (c1,) = await seed_categories(9200, 9201)
+
+    resp = await client.post("/rebates/agreements", json=agreement_payload(
+        distributor_id=201, products=[p1], product_category_ids=[c1],
+    ))
+    assert resp.status_code == 201
+    agreement_id = resp.json()["id"]
+
+    resp = await client.put(f"/rebates/agreements/{agreement_id}", json=agreement_payload(
+        distributor_id=201,
+        products=[p1, p2, p2, p1],
+        product_category_ids=[c1, c1],
+        tiers=[tier(0, 10, 1.0)],
+    ))
+    assert resp.status_code == 200
+    updated = resp.json()
+    assert sorted(updated["products"]) == [p1, p2]
+    assert updated["product_category_ids"] == [c1]
+    assert await link_count(agreement_id) == 3
+
+    # Re-sending the same payload changes nothing
+    resp = await client.put(f"/rebates/agreements/{agreement_id}", json=agreement_payload(
+        distributor_id=201,
+        products=[p2, p1],
+        product_category_ids=[c1],
+        tiers=[tier(0, 10, 1.0)],
+    ))
+    assert resp.status_code == 200
+    assert sorted(resp.json()["products"]) == [p1, p2]
+    assert [t["id"] for t in resp.json()["tiers"]] == [t["id"] for t in updated["tiers"]]
+    assert await link_count(agreement_id) == 3
+
+
+async def test_create_rebate_agreement_rejects_overlap(client):
+    (p1,) = await seed_products("RB-OVERLAP-1")
+    payload = agreement_payload(distributor_id=301, products=[p1], start_date="2024-01-01", end_date="2024-03-31")
+
+    resp = await client.post("/rebates/agreements", json=payload)
+    assert resp.status_code == 201
+
+    resp = await client.post("/rebates/agreements", json={**payload, "start_date": "2024-03-01", "end_date": "2024-06-30"})
+    assert resp.status_code == 400
+    assert "Overlapping agreement" in resp.json()["detail"]
+
+    # Neither a later date range nor another distributor overlaps
+    resp = await client.post("/rebates/agreements", json={**payload, "start_date": "2024-04-01", "end_date": "2024-06-30"})
+    assert resp.status_code == 201
+    resp = await client.post("/rebates/agreements", json={**payload, "distributor_id": 302})
+    assert resp.status_code == 201
+
+
+async def test_update_rebate_agreement_not_found_before_invalid(client):
+    (p1,) = await seed_products("RB-404-1")
+    invalid = agreement_payload(distributor_id=401, products=[p1], start_date="2024-12-31", end_date="2024-01-01")
+
+    resp = await client.put("/rebates/agreements/999999", json=invalid)
+    assert resp.status_code == 404
+
+    resp = await client.put("/rebates/agreements/999999", json=agreement_payload(distributor_id=401, products=[p1]))
+    assert resp.status_code == 404
+
+    resp = await client.post("/rebates/agreements", json=agreement_payload(distributor_id=401, products=[p1]))
+    assert resp.status_code == 201
+    resp = await client.put(f"/rebates/agreements/{resp.json()['id']}", json=invalid)
+    assert resp.status_code == 400
+    assert resp.json()["detail"] == "Start date must be before end date"
@@ -16,7 +16,7 @@ import os
 # Add the src directory to the Python path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
 
-from src.database import init_db, get_async_session
+from src.database import init_db, get_async_session, install_uvloop
 from src.db_models import Distributor, Brand
 from datetime import datetime
 
@@ -26,9 +26,13 @@ async def test_models():
     print("Testing brands and distributors models...")
     
     try:
-        # Initialize database
+        # Initialize database; the test rows are rolled back below, so
+        # existing tables and data can be kept
         print("Initializing database...")
-        await init_db(drop_existing=True)
+        await init_db(drop_existing=False)
+        
+        # One timestamp for every created/modified field
+        now = datetime.utcnow()
         
         async with get_async_session() as session:
             # Create a test distributor
@@ -37,9 +41,9 @@ async def test_models():
                 id=9999,
                 active=True,
                 modified_by="test",
-                modified=datetime.utcnow(),
+                modified=now,
                 created_by="test",
-                created=datetime.utcnow(),
+                created=now,
                 code="TEST_DIST",
                 name="Test Distributor",
                 store="TEST",
@@ -47,8 +51,6 @@ async def test_models():
                 auto_claim_over_charge=False,
                 is_central=True
             )
-            session.add(distributor)
-            await session.flush()
             
             # Create a test brand
             print("Creating test brand...")
@@ -56,16 +58,17 @@ async def test_models():
                 id=9999,
                 active=True,
                 modified_by="test",
-                modified=datetime.utcnow(),
+                modified=now,
                 created_by="test",
-                created=datetime.utcnow(),
+                created=now,
                 code="TEST_BRAND",
                 name="Test Brand",
                 store="TEST",
                 is_hof_pref=True,
                 distributor_id=distributor.id
             )
-            session.add(brand)
+            # One flush inserts both; the unit of work orders the distributor first
+            session.add_all([distributor, brand])
             await session.flush()
             
             # Test the relationship
@@ -82,18 +85,21 @@ async def test_models():
             print(f"Distributor: {distributor_with_brands.name}")
             print(f"Brands count: {len(distributor_with_brands.brands)}")
             
+            assert [b.code for b in distributor_with_brands.brands] == ["TEST_BRAND"]
+            
             if distributor_with_brands.brands:
                 print(f"First brand: {distributor_with_brands.brands[0].name}")
             
-            # Test brand to distributor relationship
-            stmt = select(Brand).options(selectinload(Brand.distributor)).where(Brand.id == brand.id)
-            result = await session.execute(stmt)
-            brand_with_distributor = result.scalar_one()
+            # Test brand to distributor relationship; the many-to-one resolves
+            # from the identity map, so no second query is needed
+            brand_with_distributor = distributor_with_brands.brands[0]
             
             print(f"Brand: {brand_with_distributor.name}")
             print(f"Distributor: {brand_with_distributor.distributor.name}")
+            assert brand_with_distributor.distributor.code == "TEST_DIST"
             
-            await session.commit()
+            # Clean up
+            await session.rollback()
             print("✅ All tests passed!")
             
     except Exception as e:
@@ -102,4 +108,5 @@ async def test_models():
 
 
 if __name__ == "__main__":
+    install_uvloop()
     asyncio.run(test_models()) 
\ No newline at end of file
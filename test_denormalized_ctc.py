@@ -6,7 +6,7 @@ Test script to verify the denormalized CTC tables structure and data.
 import asyncio
 import logging
 from sqlalchemy import text
-from src.database import get_async_session, init_db
+from src.database import get_async_session, init_db, install_uvloop
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -14,9 +14,10 @@ logger = logging.getLogger(__name__)
 async def test_denormalized_ctc():
     """Test the denormalized CTC tables structure and data."""
     try:
-        # Initialize database first
+        # Initialize database first, keeping existing tables so CTC data
+        # loaded by a previous run is reused instead of re-imported
         logger.info("Initializing database...")
-        await init_db(load_ctc_data=True)
+        await init_db(drop_existing=False, load_ctc_data=True)
         
         async with get_async_session() as session:
             logger.info("Testing denormalized CTC tables...")
@@ -24,18 +25,29 @@ async def test_denormalized_ctc():
             # Test 1: Check table counts
             logger.info("\n=== Table Counts ===")
             
-            class_result = await session.execute(text("SELECT COUNT(*) FROM ctc_classes"))
-            type_result = await session.execute(text("SELECT COUNT(*) FROM ctc_types"))
-            category_result = await session.execute(text("SELECT COUNT(*) FROM ctc_categories"))
-            
-            class_count = class_result.scalar()
-            type_count = type_result.scalar()
-            category_count = category_result.scalar()
+            # The counts and the orphan checks (Test 4) come back in one round trip
+            counts = (await session.execute(text("""
+                SELECT
+                    (SELECT COUNT(*) FROM ctc_classes) AS class_count,
+                    (SELECT COUNT(*) FROM ctc_types) AS type_count,
+                    (SELECT COUNT(*) FROM ctc_categories) AS category_count,
+                    (SELECT COUNT(*) FROM ctc_types t
+                     LEFT JOIN ctc_classes c ON t.class_id = c.id
+                     WHERE c.id IS NULL) AS orphaned_types,
+                    (SELECT COUNT(*) FROM ctc_categories cat
+                     LEFT JOIN ctc_types t ON cat.type_id = t.id
+                     WHERE t.id IS NULL) AS orphaned_categories
+            """))).one()
+            
+            class_count = counts.class_count
+            type_count = counts.type_count
+            category_count = counts.category_count
             
             logger.info(f"Classes: {class_count}")
             logger.info(f"Types: {type_count}")
             logger.info(f"Categories: {category_count}")
             logger.info(f"Total: {class_count + type_count + category_count}")
+            assert class_count > 0 and type_count > 0 and category_count > 0, "CTC tables are empty"
             
             # Test 2: Check sample data from each table
             logger.info("\n=== Sample Data ===")
@@ -107,19 +119,10 @@ async def test_denormalized_ctc():
             # Test 4: Check for any orphaned records
             logger.info("\n=== Orphan Check ===")
             
-            orphaned_types = await session.execute(text("""
-                SELECT COUNT(*) FROM ctc_types t
-                LEFT JOIN ctc_classes c ON t.class_id = c.id
-                WHERE c.id IS NULL
-            """))
-            logger.info(f"Orphaned types (no parent class): {orphaned_types.scalar()}")
-            
-            orphaned_categories = await session.execute(text("""
-                SELECT COUNT(*) FROM ctc_categories cat
-                LEFT JOIN ctc_types t ON cat.type_id = t.id
-                WHERE t.id IS NULL
-            """))
-            logger.info(f"Orphaned categories (no parent type): {orphaned_categories.scalar()}")
+            logger.info(f"Orphaned types (no parent class): {counts.orphaned_types}")
+            logger.info(f"Orphaned categories (no parent type): {counts.orphaned_categories}")
+            assert counts.orphaned_types == 0, "Found types without a parent class"
+            assert counts.orphaned_categories == 0, "Found categories without a parent type"
             
             logger.info("\n=== Test Complete ===")
             logger.info("✅ Denormalized CTC tables are working correctly!")
@@ -129,4 +132,5 @@ async def test_denormalized_ctc():
         raise
 
 if __name__ == "__main__":
+    install_uvloop()
     asyncio.run(test_denormalized_ctc()) 
\ No newline at end of file